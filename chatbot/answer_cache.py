@@ -0,0 +1,247 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Any, Dict, FrozenSet, Optional
+
+from metrics import METRICS
+
+# Answer cache settings
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "512"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "300"))  # seconds
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.6"))  # Jaccard threshold
+ANSWER_CACHE_PERSIST = os.getenv("ANSWER_CACHE_PERSIST", "False").lower() == "true"
+# Persisted lookups give up after this many seconds, and after a failure
+# are skipped for the backoff, so a slow or down MongoDB never delays answers
+ANSWER_CACHE_LOAD_TIMEOUT = float(os.getenv("ANSWER_CACHE_LOAD_TIMEOUT", "0.25"))
+ANSWER_CACHE_LOAD_BACKOFF = float(os.getenv("ANSWER_CACHE_LOAD_BACKOFF", "30"))
+
+# Words that carry no meaning for telling questions apart
+STOPWORDS = {
+    "a", "about", "an", "and", "any", "are", "can", "current", "currently", "do", "does", "for",
+    "give", "how", "i", "is", "it", "its", "know", "like", "me", "much", "now", "of", "on",
+    "please", "right", "s", "show", "tell", "the", "to", "today", "what", "whats", "you"
+}
+
+# Different ways of asking the same thing
+SYNONYMS = {
+    "at": "price", "cost": "price", "costs": "price", "priced": "price", "prices": "price",
+    "quote": "price", "trading": "price", "value": "price", "worth": "price",
+    "cap": "marketcap", "capitalization": "marketcap", "market": "marketcap",
+    "headlines": "news", "latest": "news", "updates": "news"
+}
+
+# Words that flip or set the direction of a question; two questions that
+# differ in any of these never share an answer through the similarity match
+EXACT_WORDS = {
+    "not", "no", "never", "t", "don", "doesn", "isn", "won", "shouldn", "without",
+    "buy", "sell", "long", "short", "bull", "bullish", "bear", "bearish",
+    "up", "down", "above", "below", "high", "higher", "highest", "low", "lower", "lowest",
+    "rise", "rising", "rose", "gain", "gains", "gained", "increase", "pump",
+    "drop", "dropping", "dropped", "fall", "falling", "fell", "lose", "loss", "losses", "lost",
+    "decrease", "dump", "crash", "best", "worst", "most", "least"
+}
+
+_TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+
+def normalize_question(question: str, coin_terms=()) -> FrozenSet[str]:
+    """Reduce a question to its meaningful words
+
+    Words naming the coin itself are dropped because the coin is already part
+    of the cache key, so "BTC" and "bitcoin" phrasings compare equal.
+    """
+    skip = {term.lower() for term in coin_terms}
+    tokens = set()
+    for token in _TOKEN_PATTERN.findall(question.lower()):
+        if token in STOPWORDS or token in skip:
+            continue
+        tokens.add(SYNONYMS.get(token, token))
+    return frozenset(tokens)
+
+
+def data_fingerprint(data: Dict[str, Any]) -> str:
+    """Hash the data snapshot an answer was generated from"""
+    snapshot = json.dumps(data, sort_keys=True, default=str)
+    return hashlib.sha1(snapshot.encode()).hexdigest()[:16]
+
+
+def _coin_of(data: Dict[str, Any]):
+    """Return the coin's symbol and the words that name it
+
+    For a comparison the symbols are joined, e.g. "BTC+ETH", and market-wide
+    answers are kept under "MARKET".
+    """
+    if data.get("market_summary"):
+        return "MARKET", []
+    if data.get("coins"):
+        symbols, terms = [], []
+        for row in data["coins"]:
+            symbol, row_terms = _coin_of(row)
+            symbols.append(symbol or row["coin"].upper())
+            terms.extend(row_terms + [row["coin"]])
+        return "+".join(symbols), terms
+
+    market_data = data.get("market_data") or {}
+    price_data = data.get("price_data") or {}
+    symbol = market_data.get("symbol") or price_data.get("symbol", "").replace("USDT", "")
+    terms = _TOKEN_PATTERN.findall(f"{symbol} {market_data.get('name', '')}".lower())
+    return symbol.upper(), terms
+
+
+class AnswerCache:
+    """Bounded cache of LLM answers keyed on question, coin and data snapshot
+
+    Answers for a coin are only reused while the data passed to the LLM is
+    unchanged; storing an answer for a newer snapshot drops the answers for
+    older ones. A question that is not cached verbatim can still reuse the
+    answer of the most similar question asked against the same snapshot,
+    unless the two differ in a negation or direction word (EXACT_WORDS).
+
+    With persist, answers are also kept in MongoDB: lookups there are
+    time-boxed and writes go through a write-behind queue, so neither
+    blocks the request thread on the database.
+    """
+
+    def __init__(self, max_size: int = ANSWER_CACHE_SIZE, ttl: float = ANSWER_CACHE_TTL,
+                 similarity: float = ANSWER_CACHE_SIMILARITY, persist: bool = ANSWER_CACHE_PERSIST):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.similarity = similarity
+        self.persist = persist
+        # (coin, fingerprint, tokens) -> (answer dict, stored_at)
+        self._entries = OrderedDict()
+        self._fingerprints = {}
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "similar_hits": 0, "misses": 0}
+        self._loader = ThreadPoolExecutor(max_workers=2, thread_name_prefix="answer-cache")
+        self._load_skip_until = 0.0
+        self._saver = None
+
+    def _count(self, counter: str):
+        self._stats[counter] += 1
+        METRICS.increment("answer_cache_events", event=counter)
+
+    def _key(self, question: str, data: Dict[str, Any]):
+        coin, terms = _coin_of(data)
+        return coin, data_fingerprint(data), normalize_question(question, terms)
+
+    def get(self, question: str, data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Return a cached answer for this question and data, or None"""
+        coin, fingerprint, tokens = key = self._key(question, data)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[1] < self.ttl:
+                self._entries.move_to_end(key)
+                self._count("hits")
+                return entry[0]
+
+            best, best_score = None, self.similarity
+            for (entry_coin, entry_fingerprint, entry_tokens), (answer, stored_at) in self._entries.items():
+                if entry_coin != coin or entry_fingerprint != fingerprint or now - stored_at >= self.ttl:
+                    continue
+                if (tokens ^ entry_tokens) & EXACT_WORDS:
+                    continue
+                union = tokens | entry_tokens
+                score = len(tokens & entry_tokens) / len(union) if union else 1.0
+                if score >= best_score:
+                    best, best_score = answer, score
+            if best is not None:
+                self._count("similar_hits")
+                return best
+
+        if self.persist:
+            answer = self._load(key)
+            if answer is not None:
+                self._store(key, answer)
+                with self._lock:
+                    self._count("hits")
+                return answer
+
+        with self._lock:
+            self._count("misses")
+        return None
+
+    def set(self, question: str, data: Dict[str, Any], answer: Dict[str, Any]):
+        """Cache an answer generated from this question and data"""
+        key = self._key(question, data)
+        self._store(key, answer)
+        if self.persist:
+            self._save(key, answer)
+
+    def _store(self, key, answer: Dict[str, Any]):
+        coin, fingerprint, _ = key
+        with self._lock:
+            # Answers for an older snapshot of this coin are out of date
+            if self._fingerprints.get(coin) != fingerprint:
+                for stale in [k for k in self._entries if k[0] == coin and k[1] != fingerprint]:
+                    del self._entries[stale]
+                self._fingerprints[coin] = fingerprint
+            self._entries[key] = (answer, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def _collection(self):
+        from db import get_database
+        return get_database()["answer_cache"]
+
+    @staticmethod
+    def _document_id(key) -> str:
+        coin, fingerprint, tokens = key
+        return f"{coin}|{fingerprint}|{' '.join(sorted(tokens))}"
+
+    def _load(self, key) -> Optional[Dict[str, Any]]:
+        if time.time() < self._load_skip_until:
+            return None
+        future = self._loader.submit(lambda: self._collection().find_one({"_id": self._document_id(key)}))
+        try:
+            document = future.result(timeout=ANSWER_CACHE_LOAD_TIMEOUT)
+        except FutureTimeoutError:
+            print(f"Answer cache lookup took over {ANSWER_CACHE_LOAD_TIMEOUT}s, "
+                  f"skipping MongoDB for {ANSWER_CACHE_LOAD_BACKOFF:g}s")
+            self._load_skip_until = time.time() + ANSWER_CACHE_LOAD_BACKOFF
+            return None
+        except Exception as e:
+            print(f"Error reading answer cache: {e}")
+            self._load_skip_until = time.time() + ANSWER_CACHE_LOAD_BACKOFF
+            return None
+        if document is None or time.time() - document["stored_at"] >= self.ttl:
+            return None
+        return {"answer": document["answer"], "sources": document["sources"]}
+
+    def _save(self, key, answer: Dict[str, Any]):
+        if self._saver is None:
+            from db import WriteBehindQueue
+            self._saver = WriteBehindQueue(self._write_documents, label="cached answers")
+        self._saver.put({"_id": self._document_id(key), "answer": answer["answer"],
+                         "sources": answer["sources"], "stored_at": time.time()})
+
+    def _write_documents(self, documents):
+        collection = self._collection()
+        for document in documents:
+            collection.replace_one({"_id": document["_id"]}, document, upsert=True)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters, hit rate and size"""
+        with self._lock:
+            stats = dict(self._stats, size=len(self._entries))
+        lookups = stats["hits"] + stats["similar_hits"] + stats["misses"]
+        stats["hit_rate"] = round((stats["hits"] + stats["similar_hits"]) / lookups, 3) if lookups else 0.0
+        return stats
+
+
+ANSWER_CACHE = AnswerCache()
+
+
+def _answer_cache_gauges():
+    stats = ANSWER_CACHE.stats()
+    return [("answer_cache_size", {}, stats["size"]), ("answer_cache_hit_rate", {}, stats["hit_rate"])]
+
+
+METRICS.add_collector(_answer_cache_gauges)
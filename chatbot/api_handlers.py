@@ -1,10 +1,19 @@
-import requests
+import json
 import os
+import re
+import threading
 from datetime import datetime
 import time
-from typing import Dict, List, Any
-import feedparser
-from bs4 import BeautifulSoup
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Dict, List, Any, Optional
+
+from config import TOP_COINS_LIMIT
+from cache import MISSING, TTLCache
+from cache_backends import create_backend
+from http_client import PROVIDERS
+from metrics import METRICS
+from price_history import PRICE_HISTORY
+from price_stream import PRICE_STREAM_ENABLED, PRICE_STREAM_TOP_N, get_streamed_price, start_price_stream
 
 # API Keys - should be set as environment variables
 COINMARKETCAP_API_KEY = os.getenv("COINMARKETCAP_API_KEY", "")
@@ -13,74 +22,194 @@ BINANCE_API_KEY = os.getenv("BINANCE_API_KEY", "")
 BINANCE_SECRET_KEY = os.getenv("BINANCE_SECRET_KEY", "")
 CRYPTOPANIC_API_KEY = os.getenv("CRYPTOPANIC_API_KEY", "")
 
+# Provider base URLs - can be pointed at a local mock server
+COINGECKO_API_URL = os.getenv("COINGECKO_API_URL", "https://api.coingecko.com/api/v3")
+BINANCE_API_URL = os.getenv("BINANCE_API_URL", "https://api.binance.com/api/v3")
+COINMARKETCAP_API_URL = os.getenv("COINMARKETCAP_API_URL", "https://pro-api.coinmarketcap.com/v1")
+
 # Cache to store data and minimize API calls
-CACHE = {}
 CACHE_EXPIRY = {
     "news": 5 * 60,  # 5 minutes for news
     "market": 2 * 60,  # 2 minutes for market data
-    "price": 30  # 30 seconds for price data
+    "price": 30,  # 30 seconds for price data
+    "top_coins": 2 * 60,  # 2 minutes for the top coins list
+    "markets": 2 * 60,  # 2 minutes for the CoinGecko markets snapshot
+    "profile": 24 * 60 * 60,  # 1 day for coin descriptions and homepages
+    "cmc_map": 24 * 60 * 60,  # 1 day for the CoinMarketCap ID map
+    "cmc_map_failed": 5 * 60,  # 5 minutes before retrying a failed map download
+    "binance_missing": 24 * 60 * 60  # 1 day for pairs Binance does not list
+}
+CACHE_MAX_SIZE = int(os.getenv("CACHE_MAX_SIZE", "1024"))
+# Shared between replicas when CACHE_BACKEND is redis or mongo
+CACHE = TTLCache(CACHE_EXPIRY, max_size=CACHE_MAX_SIZE, backend=create_backend())
+
+# Seconds past expiry during which a cached value is still served while a
+# single background call refreshes it (0 disables stale-while-revalidate)
+STALE_WHILE_REVALIDATE = float(os.getenv("STALE_WHILE_REVALIDATE", "0"))
+
+# Per-source deadlines (seconds) for get_aggregated_data. A source that misses
+# its deadline is returned empty and keeps running in the background so its
+# result still lands in the cache for the next query.
+SOURCE_DEADLINES = {
+    "market": float(os.getenv("MARKET_DEADLINE", "8")),
+    "price": float(os.getenv("PRICE_DEADLINE", "5")),
+    "news": float(os.getenv("NEWS_DEADLINE", "10"))
+}
+
+# Shared worker pool for concurrent upstream fetches
+_EXECUTOR = ThreadPoolExecutor(max_workers=8, thread_name_prefix="fetch")
+
+# Binance symbols for coins we know without a CoinGecko lookup
+BINANCE_SYMBOLS = {
+    "bitcoin": "BTC",
+    "ethereum": "ETH",
+    "binancecoin": "BNB",
+    "solana": "SOL",
+    "ripple": "XRP",
+    "cardano": "ADA",
+    "dogecoin": "DOGE",
+    "polkadot": "DOT",
+    "avalanche-2": "AVAX",
+    "chainlink": "LINK",
+    "matic-network": "MATIC",
+    "shiba-inu": "SHIB"
 }
 
 
-def fetch_crypto_news(coin: str, limit: int = 5) -> List[Dict[str, Any]]:
-    """Fetch news for a specific cryptocurrency from Coindesk RSS feed"""
-    cache_key = f"news_{coin}"
+# Coindesk RSS feed, downloaded once per news TTL and shared by all coins
+COINDESK_RSS_URL = os.getenv("COINDESK_RSS_URL", "https://www.coindesk.com/arc/outboundfeeds/rss/")
+
+# Last successful feed download, reused when the server answers 304
+_news_feed = {"etag": None, "modified": None, "entries": None}
+
+# Search index over the cached entries, rebuilt when they change
+_news_index = {"source": None, "index": None}
+_news_index_lock = threading.Lock()
+
+
+class NewsIndex:
+    """Parsed feed entries with an inverted index from word to entry positions"""
+
+    def __init__(self, entries: List[Dict[str, Any]]):
+        self.entries = entries
+        self.postings = {}
+        for position, entry in enumerate(entries):
+            text = f"{entry['title']} {entry['description']}".lower()
+            for token in set(_TOKEN_PATTERN.findall(text)):
+                self.postings.setdefault(token, []).append(position)
 
-    # Check cache first
-    if cache_key in CACHE and (time.time() - CACHE[cache_key]["timestamp"]) < CACHE_EXPIRY["news"]:
-        return CACHE[cache_key]["data"]
+    def __len__(self) -> int:
+        return len(self.entries)
 
+    def search(self, keywords: List[str], limit: int = 5) -> List[Dict[str, Any]]:
+        """Return entries mentioning any keyword phrase, in feed order
+
+        Single words that are also everyday words (AMBIGUOUS_COIN_WORDS, e.g.
+        the LINK or NEAR symbols) are skipped, so those coins are matched on
+        their name only instead of on every article using the word.
+        """
+        matches = set()
+        for keyword in keywords:
+            tokens = _TOKEN_PATTERN.findall(keyword.lower())
+            if not tokens or (len(tokens) == 1 and tokens[0] in AMBIGUOUS_COIN_WORDS):
+                continue
+            # Multi-word names must have all of their words in the entry
+            positions = set(self.postings.get(tokens[0], []))
+            for token in tokens[1:]:
+                positions &= set(self.postings.get(token, []))
+            matches |= positions
+        return [self.entries[position] for position in sorted(matches)[:limit]]
+
+
+@CACHE.cached("news", key=lambda: "coindesk", stale_while_revalidate=STALE_WHILE_REVALIDATE)
+def fetch_news_entries() -> List[Dict[str, Any]]:
+    """Download and parse the Coindesk RSS feed
+
+    Uses a conditional GET, so an unchanged feed costs a 304 and reuses the
+    previous entries. HTML is stripped once per entry here rather than per coin.
+    """
+    try:
+        headers = {}
+        if _news_feed["etag"]:
+            headers["If-None-Match"] = _news_feed["etag"]
+        if _news_feed["modified"]:
+            headers["If-Modified-Since"] = _news_feed["modified"]
+
+        print(f"Fetching RSS feed from {COINDESK_RSS_URL}")
+        response = PROVIDERS["coindesk"].get(COINDESK_RSS_URL, endpoint="rss", headers=headers)
+        if response.status_code == 304 and _news_feed["entries"] is not None:
+            return _news_feed["entries"]
+        response.raise_for_status()
+
+        # Imported here rather than at startup; only news refreshes need them
+        import feedparser
+        from bs4 import BeautifulSoup
+
+        feed = feedparser.parse(response.content)
+        if not feed.entries:
+            print("No entries found in RSS feed")
+            return []
+
+        entries = []
+        for entry in feed.entries:
+            # Extract clean text from HTML description
+            description = BeautifulSoup(entry.get("description", ""), 'html.parser').get_text()
+            entries.append({
+                "title": entry.get("title", ""),
+                "url": entry.get("link", ""),
+                "source": "Coindesk",
+                "published_at": entry.get("published", ""),
+                "description": description
+            })
+
+        _news_feed.update({
+            "etag": response.headers.get("ETag"),
+            "modified": response.headers.get("Last-Modified"),
+            "entries": entries
+        })
+        return entries
+    except Exception as e:
+        print(f"Error fetching RSS feed: {e}")
+        return []
+
+
+def fetch_news_index() -> Optional[NewsIndex]:
+    """Return a search index over the cached Coindesk entries, or None without news
+
+    The entries are what is cached (and shared between replicas); the index
+    is rebuilt locally only when a different entries list comes back.
+    """
+    entries = fetch_news_entries()
+    if not entries:
+        return None
+    with _news_index_lock:
+        if entries is not _news_index["source"]:
+            _news_index["index"] = NewsIndex(entries)
+            _news_index["source"] = entries
+        return _news_index["index"]
+
+
+def fetch_crypto_news(coin: str, limit: int = 5,
+                      market_data: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    """Fetch news for a specific cryptocurrency from Coindesk RSS feed
+
+    market_data may be passed in when the caller already resolved it, to avoid
+    a second CoinGecko lookup for the coin's symbol and name.
+    """
     try:
         # Get the symbol and name for the coin
-        market_data = fetch_market_data(coin)
+        if market_data is None:
+            market_data = fetch_market_data(coin)
         if not market_data or "symbol" not in market_data:
             print(f"Could not get market data for {coin}")
             return []
-        
-        symbol = market_data["symbol"]
-        name = market_data["name"]
-        
-        # Fetch RSS feed from Coindesk
-        feed_url = "https://www.coindesk.com/arc/outboundfeeds/rss/"
-        print(f"Fetching RSS feed from {feed_url}")
-        feed = feedparser.parse(feed_url)
-        
-        if not feed.entries:
-            print("No entries found in RSS feed")
+
+        index = fetch_news_index()
+        if index is None:
             return []
-        
-        # Process news data
-        news_items = []
-        keywords = [symbol.lower(), name.lower()]
-        
-        for entry in feed.entries:
-            if len(news_items) >= limit:
-                break
-                
-            # Check if the entry is related to our coin
-            title_lower = entry.title.lower()
-            description_lower = entry.description.lower()
-            
-            if any(keyword in title_lower or keyword in description_lower for keyword in keywords):
-                # Extract clean text from HTML description
-                soup = BeautifulSoup(entry.description, 'html.parser')
-                description = soup.get_text()
-                
-                news_items.append({
-                    "title": entry.title,
-                    "url": entry.link,
-                    "source": "Coindesk",
-                    "published_at": entry.published,
-                    "description": description
-                })
 
+        news_items = index.search([market_data["symbol"], market_data["name"]], limit)
         print(f"Found {len(news_items)} news items for {coin}")
-        
-        # Update cache
-        CACHE[cache_key] = {
-            "data": news_items,
-            "timestamp": time.time()
-        }
 
         return news_items
     except Exception as e:
@@ -88,259 +217,565 @@ def fetch_crypto_news(coin: str, limit: int = 5) -> List[Dict[str, Any]]:
         return []
 
 
-def get_coinmarketcap_id(coin: str) -> str:
-    """Get CoinMarketCap ID for a given coin"""
-    cache_key = f"cmc_id_{coin}"
+# Local copy of the CoinMarketCap ID map for fast warm starts
+CMC_MAP_FILE = os.getenv("CMC_MAP_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                      ".cache", "cmc_map.json"))
+
+
+@CACHE.cached("cmc_map", key=lambda: "map")
+def fetch_cmc_map() -> Dict[str, Dict[str, int]]:
+    """Load the CoinMarketCap ID map as slug/symbol/name -> id dictionaries
 
-    # Check cache first
-    if cache_key in CACHE and (time.time() - CACHE[cache_key]["timestamp"]) < CACHE_EXPIRY["market"]:
-        return CACHE[cache_key]["data"]
+    The map covers thousands of assets, so it is downloaded at most once per
+    day and persisted to CMC_MAP_FILE; a fresh file is used instead of the
+    API. If the download fails, an older file is still used, and otherwise
+    the failure is remembered for a few minutes before retrying.
+    """
+    file_age = time.time() - os.path.getmtime(CMC_MAP_FILE) if os.path.exists(CMC_MAP_FILE) else None
+    if file_age is not None and file_age < CACHE.ttl("cmc_map"):
+        cmc_map = _load_cmc_map()
+        if cmc_map:
+            return cmc_map
+
+    if CACHE.get("cmc_map_failed", "map") is not MISSING:
+        return _load_cmc_map() if file_age is not None else {}
 
     try:
-        url = "https://pro-api.coinmarketcap.com/v1/cryptocurrency/map"
+        url = f"{COINMARKETCAP_API_URL}/cryptocurrency/map"
         headers = {
             'X-CMC_PRO_API_KEY': COINMARKETCAP_API_KEY,
             'Accept': 'application/json'
         }
 
-        response = requests.get(url, headers=headers)
+        response = PROVIDERS["coinmarketcap"].get(url, endpoint="/cryptocurrency/map", headers=headers,
+                                                  params={"sort": "cmc_rank"})
         response.raise_for_status()
         data = response.json()
 
-        coin_lower = coin.lower()
+        # Sorted by rank, so the best-ranked asset keeps a shared symbol/name
+        cmc_map = {"slug": {}, "symbol": {}, "name": {}}
         for crypto in data.get("data", []):
-            if (crypto["name"].lower() == coin_lower or
-                    crypto["symbol"].lower() == coin_lower):
-                # Update cache
-                CACHE[cache_key] = {
-                    "data": str(crypto["id"]),
-                    "timestamp": time.time()
-                }
-                return str(crypto["id"])
-
-        return ""
+            for field in cmc_map:
+                cmc_map[field].setdefault(crypto[field].lower(), crypto["id"])
+
+        os.makedirs(os.path.dirname(CMC_MAP_FILE), exist_ok=True)
+        with open(CMC_MAP_FILE, "w") as f:
+            json.dump(cmc_map, f, separators=(",", ":"))
+        return cmc_map
     except Exception as e:
-        print(f"Error fetching CoinMarketCap ID for {coin}: {e}")
-        return ""
+        print(f"Error fetching CoinMarketCap ID map: {e}")
+        CACHE.set("cmc_map_failed", "map", True)
+        return _load_cmc_map() if file_age is not None else {}
 
 
-def fetch_market_data(coin: str) -> Dict[str, Any]:
-    """Fetch market data for a specific cryptocurrency from CoinGecko API"""
-    cache_key = f"market_{coin}"
+def _load_cmc_map() -> Dict[str, Dict[str, int]]:
+    """Read the persisted CoinMarketCap ID map, or {} if unreadable"""
+    try:
+        with open(CMC_MAP_FILE) as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Error reading {CMC_MAP_FILE}: {e}")
+        return {}
 
-    # Check cache first
-    if cache_key in CACHE and (time.time() - CACHE[cache_key]["timestamp"]) < CACHE_EXPIRY["market"]:
-        return CACHE[cache_key]["data"]
 
-    try:
-        url = f"https://api.coingecko.com/api/v3/coins/{get_coingecko_id(coin)}"
-        if COINGECKO_API_KEY:
-            url += f"?x_cg_api_key={COINGECKO_API_KEY}"
+def get_coinmarketcap_id(coin: str) -> str:
+    """Get CoinMarketCap ID for a given coin
+
+    Lookups, including misses, are dictionary reads on the cached ID map and
+    never trigger another download.
+    """
+    cmc_map = fetch_cmc_map()
+    coin_lower = coin.lower()
+    for field in ("slug", "name", "symbol"):
+        cmc_id = cmc_map.get(field, {}).get(coin_lower)
+        if cmc_id is not None:
+            return str(cmc_id)
+    return ""
 
-        headers = {"accept": "application/json"}
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()
-        data = response.json()
 
-        # Process market data
-        market_data = {
-            "name": data["name"],
-            "symbol": data["symbol"].upper(),
-            "market_cap_rank": data.get("market_cap_rank", "N/A"),
-            "market_cap_usd": data.get("market_data", {}).get("market_cap", {}).get("usd", "N/A"),
-            "volume_24h": data.get("market_data", {}).get("total_volume", {}).get("usd", "N/A"),
-            "price_change_24h": data.get("market_data", {}).get("price_change_percentage_24h", "N/A"),
-            "description": data.get("description", {}).get("en", "").split(".")[0] + "." if data.get("description",
-                                                                                                     {}).get(
-                "en") else "",
-            "homepage": data.get("links", {}).get("homepage", [""])[0]
-        }
+# Query params that keep /coins/markets responses small
+COINGECKO_MARKETS_PARAMS = {
+    "vs_currency": "usd",
+    "order": "market_cap_desc",
+    "page": 1,
+    "sparkline": "false",
+    "price_change_percentage": "24h",
+    "locale": "en"
+}
 
-        # Update cache
-        CACHE[cache_key] = {
-            "data": market_data,
-            "timestamp": time.time()
-        }
 
-        return market_data
-    except Exception as e:
-        print(f"Error fetching market data for {coin}: {e}")
-        return {}
+def _coingecko_get(path: str, params: Dict[str, Any], endpoint: str = None) -> Any:
+    """GET a CoinGecko API path and return the decoded JSON"""
+    if COINGECKO_API_KEY:
+        params = dict(params, x_cg_api_key=COINGECKO_API_KEY)
+    headers = {"accept": "application/json"}
+    response = PROVIDERS["coingecko"].get(f"{COINGECKO_API_URL}{path}", endpoint=endpoint,
+                                          headers=headers, params=params)
+    response.raise_for_status()
+    return response.json()
 
 
-def fetch_price_data(coin: str) -> Dict[str, Any]:
-    """Fetch current price data for a specific cryptocurrency from Binance API"""
-    cache_key = f"price_{coin}"
-
-    # Check cache first
-    if cache_key in CACHE and (time.time() - CACHE[cache_key]["timestamp"]) < CACHE_EXPIRY["price"]:
-        return CACHE[cache_key]["data"]
-
-    # Convert coin name to Binance symbol
-    symbol_mapping = {
-        "bitcoin": "BTC",
-        "ethereum": "ETH",
-        "binancecoin": "BNB",
-        "solana": "SOL",
-        "ripple": "XRP",
-        "cardano": "ADA",
-        "dogecoin": "DOGE",
-        "polkadot": "DOT",
-        "avalanche-2": "AVAX",
-        "chainlink": "LINK",
-        "matic-network": "MATIC",
-        "shiba-inu": "SHIB"
+def _parse_market_row(row: Dict[str, Any]) -> Dict[str, Any]:
+    """Convert a /coins/markets row into our market data format"""
+    return {
+        "id": row["id"],
+        "name": row["name"],
+        "symbol": row["symbol"].upper(),
+        "market_cap_rank": row.get("market_cap_rank") or "N/A",
+        "market_cap_usd": row.get("market_cap") if row.get("market_cap") is not None else "N/A",
+        "volume_24h": row.get("total_volume") if row.get("total_volume") is not None else "N/A",
+        "price_change_24h": row.get("price_change_percentage_24h") if row.get("price_change_percentage_24h") is not None else "N/A",
+        "current_price": row.get("current_price")
     }
 
-    # Get the symbol from mapping or use the coin's symbol from market data
-    symbol = symbol_mapping.get(coin.lower(), "")
-    if not symbol:
-        # If not in mapping, try to get from market data
-        market_data = fetch_market_data(coin)
-        if market_data and "symbol" in market_data:
-            symbol = market_data["symbol"]
-        else:
+
+@CACHE.cached("markets", key=lambda limit=TOP_COINS_LIMIT: limit,
+               stale_while_revalidate=STALE_WHILE_REVALIDATE)
+def fetch_markets_snapshot(limit: int = TOP_COINS_LIMIT) -> Dict[str, Dict[str, Any]]:
+    """Fetch market data for the top coins from one CoinGecko /coins/markets call
+
+    Returns market data keyed by CoinGecko ID, in market cap order.
+    """
+    try:
+        data = _coingecko_get("/coins/markets", dict(COINGECKO_MARKETS_PARAMS, per_page=limit))
+        snapshot = {row["id"]: _parse_market_row(row) for row in data}
+        PRICE_HISTORY.record_many({coin_id: row["current_price"] for coin_id, row in snapshot.items()})
+        return snapshot
+    except Exception as e:
+        print(f"Error fetching markets snapshot: {e}")
+        return {}
+
+
+@CACHE.cached("market", stale_while_revalidate=STALE_WHILE_REVALIDATE)
+def fetch_coin_markets(coin_id: str) -> Dict[str, Any]:
+    """Fetch market data for a coin outside the top coins snapshot"""
+    try:
+        data = _coingecko_get("/coins/markets", dict(COINGECKO_MARKETS_PARAMS, ids=coin_id))
+        if not data:
             return {}
+        market_data = _parse_market_row(data[0])
+        PRICE_HISTORY.record(coin_id, market_data["current_price"])
+        return market_data
+    except Exception as e:
+        print(f"Error fetching market data for {coin_id}: {e}")
+        return {}
 
-    symbol = f"{symbol}USDT"
 
+@CACHE.cached("profile")
+def fetch_coin_profile(coin_id: str) -> Dict[str, str]:
+    """Fetch a coin's description and homepage, which rarely change"""
     try:
-        url = f"https://api.binance.com/api/v3/ticker/price?symbol={symbol}"
-        response = requests.get(url)
-        response.raise_for_status()
-        price_data = response.json()
-
-        url_24h = f"https://api.binance.com/api/v3/ticker/24hr?symbol={symbol}"
-        response_24h = requests.get(url_24h)
-        response_24h.raise_for_status()
-        data_24h = response_24h.json()
-
-        price_info = {
-            "symbol": symbol,
-            "price": float(price_data["price"]),
-            "price_change_percent": float(data_24h.get("priceChangePercent", 0)),
-            "high_24h": float(data_24h.get("highPrice", 0)),
-            "low_24h": float(data_24h.get("lowPrice", 0)),
-            "volume_24h": float(data_24h.get("volume", 0))
+        data = _coingecko_get(f"/coins/{coin_id}", endpoint="/coins/{id}", params={
+            "localization": "false",
+            "tickers": "false",
+            "market_data": "false",
+            "community_data": "false",
+            "developer_data": "false",
+            "sparkline": "false"
+        })
+        description = data.get("description", {}).get("en", "")
+        return {
+            "description": description.split(".")[0] + "." if description else "",
+            "homepage": (data.get("links", {}).get("homepage") or [""])[0]
         }
+    except Exception as e:
+        print(f"Error fetching profile for {coin_id}: {e}")
+        return {}
+
+
+def fetch_market_data(coin: str, include_profile: bool = True) -> Dict[str, Any]:
+    """Fetch market data for a specific cryptocurrency from CoinGecko API
+
+    Market figures come from the shared top coins snapshot when the coin is
+    in it, and from a single-coin markets call otherwise. The description
+    and homepage are merged in from the long-lived profile cache unless
+    include_profile is False.
+    """
+    coin_id = get_coingecko_id(coin)
+    market_data = fetch_markets_snapshot().get(coin_id) or fetch_coin_markets(coin_id)
+    if not market_data or not include_profile:
+        return market_data
+
+    profile = fetch_coin_profile(coin_id)
+    return dict(market_data,
+                description=profile.get("description", ""),
+                homepage=profile.get("homepage", ""))
+
+
+def fetch_price_data(coin: str, market_data: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Fetch current price data for a specific cryptocurrency from Binance API
+
+    Served from the live price stream when it is running and fresh, otherwise
+    from the cached REST ticker. market_data is only consulted for coins
+    outside BINANCE_SYMBOLS and the top coins list; pass it in when already
+    resolved to skip the extra CoinGecko lookup.
+    """
+    streamed = _streamed_price(coin)
+    if streamed:
+        return streamed
+    return fetch_price_rest(coin, market_data)
 
-        # Update cache
-        CACHE[cache_key] = {
-            "data": price_info,
-            "timestamp": time.time()
-        }
 
-        return price_info
+def _streamed_price(coin: str) -> Optional[Dict[str, Any]]:
+    """Return live price data for a coin from the price stream, if available"""
+    symbol = _known_binance_symbol(coin)
+    return get_streamed_price(f"{symbol}USDT") if symbol else None
+
+
+# Binance error code for a pair it does not list
+BINANCE_INVALID_SYMBOL = -1121
+
+
+def _is_invalid_symbol(response) -> bool:
+    if response.status_code != 400:
+        return False
+    try:
+        return response.json().get("code") == BINANCE_INVALID_SYMBOL
+    except Exception:
+        return False
+
+
+@CACHE.cached("price", key=lambda coin, market_data=None: coin,
+               stale_while_revalidate=STALE_WHILE_REVALIDATE)
+def fetch_price_rest(coin: str, market_data: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Fetch current price data for a cryptocurrency from the Binance REST API
+
+    Pairs Binance does not list are remembered in "binance_missing", so
+    coins like Tether cost no request until that entry expires.
+    """
+    symbol = get_binance_symbol(coin, market_data)
+    if not symbol or CACHE.get("binance_missing", symbol) is not MISSING:
+        return {}
+
+    try:
+        # The 24hr ticker already carries the last price, so one call is enough
+        url = f"{BINANCE_API_URL}/ticker/24hr"
+        response = PROVIDERS["binance"].get(url, weight=2, params={"symbol": symbol})
+        if _is_invalid_symbol(response):
+            CACHE.set("binance_missing", symbol, True)
+            return {}
+        response.raise_for_status()
+
+        return _parse_binance_ticker(response.json())
     except Exception as e:
         print(f"Error fetching price data for {symbol}: {e}")
         return {}
 
 
+def fetch_prices_batch(coins: List[str], refresh: bool = False) -> Dict[str, Dict[str, Any]]:
+    """Fetch price data for many cryptocurrencies with a single Binance call
+
+    Coins with live or fresh cached prices are served locally unless refresh
+    is set; the rest are requested together and written back to the per-coin
+    price cache, so later fetch_price_data calls for them are cache hits.
+    """
+    prices = {}
+    pending = {}
+    for coin in coins:
+        streamed = _streamed_price(coin)
+        if streamed:
+            prices[coin] = streamed
+            continue
+        cached = MISSING if refresh else CACHE.get("price", coin)
+        if cached is not MISSING:
+            prices[coin] = cached
+            continue
+        symbol = get_binance_symbol(coin)
+        if symbol and CACHE.get("binance_missing", symbol) is MISSING:
+            pending.setdefault(symbol, []).append(coin)
+
+    if not pending:
+        return prices
+
+    try:
+        url = f"{BINANCE_API_URL}/ticker/24hr"
+        symbols = json.dumps(sorted(pending), separators=(",", ":"))
+        response = PROVIDERS["binance"].get(url, weight=2 if len(pending) <= 20 else 40,
+                                            params={"symbols": symbols})
+        if response.status_code == 400:
+            # Binance rejects the whole batch if any pair is unknown, so fall
+            # back to the full-market snapshot and remember the unknown pairs
+            response = PROVIDERS["binance"].get(url, endpoint="/ticker/24hr (all)", weight=80)
+        response.raise_for_status()
+
+        tickers = {ticker["symbol"]: ticker for ticker in response.json()}
+        for symbol, symbol_coins in pending.items():
+            if symbol not in tickers:
+                CACHE.set("binance_missing", symbol, True)
+                continue
+            price_info = _parse_binance_ticker(tickers[symbol])
+            for coin in symbol_coins:
+                CACHE.set("price", coin, price_info)
+                prices[coin] = price_info
+    except Exception as e:
+        print(f"Error fetching batch price data: {e}")
+
+    return prices
+
+
+def _parse_binance_ticker(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Convert a Binance 24hr ticker into our price data format"""
+    return {
+        "symbol": data["symbol"],
+        "price": float(data["lastPrice"]),
+        "price_change_percent": float(data.get("priceChangePercent", 0)),
+        "high_24h": float(data.get("highPrice", 0)),
+        "low_24h": float(data.get("lowPrice", 0)),
+        "volume_24h": float(data.get("volume", 0))
+    }
+
+
+def _known_binance_symbol(coin: str) -> str:
+    """Return a coin's base symbol if known without a market data lookup"""
+    coin = coin.lower()
+    return BINANCE_SYMBOLS.get(coin) or get_coin_index().symbols.get(coin, "")
+
+
+def get_binance_symbol(coin: str, market_data: Optional[Dict[str, Any]] = None) -> str:
+    """Return the Binance USDT trading pair for a coin, or "" if unknown"""
+    symbol = _known_binance_symbol(coin)
+    if not symbol:
+        # If not in mapping, try to get from market data
+        if market_data is None:
+            market_data = fetch_market_data(coin)
+        if market_data and "symbol" in market_data:
+            symbol = market_data["symbol"]
+        else:
+            return ""
+
+    return f"{symbol.upper()}USDT"
+
+
+def start_live_prices():
+    """Start the optional Binance WebSocket feed for the top coins
+
+    Does nothing unless PRICE_STREAM_ENABLED is set; REST stays the fallback
+    whenever the stream is down or stale.
+    """
+    # Checked before get_top_coins, which would otherwise hit CoinGecko at startup
+    if not PRICE_STREAM_ENABLED:
+        return None
+    top_coins = get_top_coins()[:PRICE_STREAM_TOP_N]
+    symbols = [f"{coin['symbol'].upper()}USDT" for coin in top_coins]
+    return start_price_stream(symbols)
+
+
+# Common names/symbols that differ from CoinGecko IDs
+COINGECKO_IDS = {
+    "btc": "bitcoin",
+    "bitcoin": "bitcoin",
+    "eth": "ethereum",
+    "ethereum": "ethereum",
+    "bnb": "binancecoin",
+    "sol": "solana",
+    "solana": "solana",
+    "xrp": "ripple",
+    "ada": "cardano",
+    "cardano": "cardano",
+    "doge": "dogecoin",
+    "dogecoin": "dogecoin",
+    "dot": "polkadot",
+    "polkadot": "polkadot",
+    "avax": "avalanche-2",
+    "avalanche": "avalanche-2",
+    "link": "chainlink",
+    "chainlink": "chainlink",
+    "matic": "matic-network",
+    "polygon": "matic-network",
+    "shib": "shiba-inu",
+    "shiba inu": "shiba-inu"
+}
+
+
 def get_coingecko_id(coin: str) -> str:
     """Convert common coin names/symbols to CoinGecko IDs"""
     coin = coin.lower()
+    return COINGECKO_IDS.get(coin, coin)
 
-    # Common mappings
-    mapping = {
-        "btc": "bitcoin",
-        "bitcoin": "bitcoin",
-        "eth": "ethereum",
-        "ethereum": "ethereum",
-        "bnb": "binancecoin",
-        "sol": "solana",
-        "solana": "solana",
-        "xrp": "ripple",
-        "ada": "cardano",
-        "cardano": "cardano",
-        "doge": "dogecoin",
-        "dogecoin": "dogecoin",
-        "dot": "polkadot",
-        "polkadot": "polkadot",
-        "avax": "avalanche-2",
-        "avalanche": "avalanche-2",
-        "link": "chainlink",
-        "chainlink": "chainlink",
-        "matic": "matic-network",
-        "polygon": "matic-network",
-        "shib": "shiba-inu",
-        "shiba inu": "shiba-inu"
-    }
 
-    return mapping.get(coin, coin)
+@CACHE.cached("top_coins", key=lambda limit=TOP_COINS_LIMIT: limit,
+               stale_while_revalidate=STALE_WHILE_REVALIDATE)
+def get_top_coins(limit: int = TOP_COINS_LIMIT) -> List[Dict[str, str]]:
+    """Get top cryptocurrencies by market cap from CoinGecko"""
+    snapshot = fetch_markets_snapshot(max(limit, TOP_COINS_LIMIT))
+    return [{
+        "id": coin["id"],
+        "symbol": coin["symbol"].lower(),
+        "name": coin["name"],
+        "market_cap_rank": coin["market_cap_rank"]
+    } for coin in list(snapshot.values())[:limit]]
+
+
+# Symbols and names that are also everyday words; these only count as a coin
+# mention when written in upper case ("NEAR", "TON", "LINK")
+AMBIGUOUS_COIN_WORDS = {
+    "a", "ai", "an", "and", "are", "at", "be", "can", "for", "gas", "in", "is",
+    "it", "just", "link", "max", "me", "near", "not", "now", "of", "on", "one", "or",
+    "sun", "the", "to", "ton", "trump", "usual", "we", "win"
+}
 
+_TOKEN_PATTERN = re.compile(r"[A-Za-z0-9]+")
+
+
+class CoinIndex:
+    """Token-boundary lookup of coin IDs by symbol, name, ID and alias
+
+    Phrases are stored as token tuples, so lookup cost depends on the query
+    length and the longest phrase rather than on the number of coins, and
+    "sol" no longer matches inside "solution".
+    """
+
+    def __init__(self, coins: List[Dict[str, Any]], aliases: Dict[str, str]):
+        self.phrases = {}
+        self.symbols = {coin["id"]: coin["symbol"].upper() for coin in coins}
+        # Curated aliases win over names from the (rank-ordered) coin list
+        for alias, coin_id in aliases.items():
+            self._add(alias, coin_id)
+        for coin in coins:
+            for phrase in (coin["symbol"], coin["name"], coin["id"]):
+                self._add(phrase, coin["id"])
+        self.max_length = max((len(phrase) for phrase in self.phrases), default=0)
+
+    def _add(self, phrase: str, coin_id: str):
+        tokens = tuple(token.lower() for token in _TOKEN_PATTERN.findall(phrase))
+        if tokens:
+            self.phrases.setdefault(tokens, coin_id)
+
+    def find(self, query: str) -> List[str]:
+        """Return every coin mentioned in the query, in order of appearance"""
+        raw_tokens = _TOKEN_PATTERN.findall(query)
+        tokens = [token.lower() for token in raw_tokens]
+        found = []
+        i = 0
+        while i < len(tokens):
+            # Prefer the longest phrase, so "wrapped bitcoin" beats "bitcoin"
+            for length in range(min(self.max_length, len(tokens) - i), 0, -1):
+                phrase = tuple(tokens[i:i + length])
+                coin_id = self.phrases.get(phrase)
+                if coin_id is None:
+                    continue
+                if length == 1 and phrase[0] in AMBIGUOUS_COIN_WORDS and not raw_tokens[i].isupper():
+                    continue
+                if coin_id not in found:
+                    found.append(coin_id)
+                i += length
+                break
+            else:
+                i += 1
+        return found
 
-def get_top_coins(limit: int = 50) -> List[Dict[str, str]]:
-    """Get top cryptocurrencies by market cap from CoinGecko"""
-    cache_key = "top_coins"
 
-    # Check cache first
-    if cache_key in CACHE and (time.time() - CACHE[cache_key]["timestamp"]) < CACHE_EXPIRY["market"]:
-        return CACHE[cache_key]["data"]
+_coin_index = {"source": None, "index": None}
+_coin_index_lock = threading.Lock()
 
-    try:
-        url = f"https://api.coingecko.com/api/v3/coins/markets?vs_currency=usd&order=market_cap_desc&per_page={limit}&page=1"
-        if COINGECKO_API_KEY:
-            url += f"&x_cg_api_key={COINGECKO_API_KEY}"
 
-        headers = {"accept": "application/json"}
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()
-        data = response.json()
+def get_coin_index() -> CoinIndex:
+    """Return the coin index, rebuilding it when the top coins list changes"""
+    top_coins = get_top_coins()
+    with _coin_index_lock:
+        source = _coin_index["source"]
+        if _coin_index["index"] is None or (top_coins is not source and (top_coins or source)):
+            _coin_index["index"] = CoinIndex(top_coins, COINGECKO_IDS)
+            _coin_index["source"] = top_coins
+        return _coin_index["index"]
 
-        coins = [{
-            "id": coin["id"],
-            "symbol": coin["symbol"],
-            "name": coin["name"],
-            "market_cap_rank": coin["market_cap_rank"]
-        } for coin in data]
-
-        # Update cache
-        CACHE[cache_key] = {
-            "data": coins,
-            "timestamp": time.time()
-        }
 
-        return coins
-    except Exception as e:
-        print(f"Error fetching top coins: {e}")
-        return []
+def identify_coins(query: str) -> List[str]:
+    """Extract every cryptocurrency mentioned in a user query"""
+    return get_coin_index().find(query)
 
 
 def identify_coin(query: str) -> str:
     """Extract cryptocurrency from user query"""
-    query = query.lower()
+    coins = identify_coins(query)
+    return coins[0] if coins else ""
 
-    # Get top coins
-    top_coins = get_top_coins()
 
-    # Check for coin mentions in query
-    for coin in top_coins:
-        if coin["id"].lower() in query or coin["symbol"].lower() in query or coin["name"].lower() in query:
-            return coin["id"]
-
-    # Check common names that might differ from official names
-    common_names = {
-        "btc": "bitcoin",
-        "eth": "ethereum",
-        "xrp": "ripple",
-        "bnb": "binancecoin"
-    }
+def _await(future, deadline: float, source: str, default):
+    """Wait for a fetch until its deadline, falling back to a default value"""
+    try:
+        return future.result(timeout=max(0.0, deadline - time.monotonic()))
+    except FutureTimeoutError:
+        print(f"{source} data missed its {SOURCE_DEADLINES[source]}s deadline, returning partial results")
+        return default
+    except Exception as e:
+        print(f"Error fetching {source} data: {e}")
+        return default
 
-    for symbol, coin_id in common_names.items():
-        if symbol in query:
-            return coin_id
 
-    return ""
+def _timed(source: str, func, *args, **kwargs):
+    """Run a fetch inside a timing span named after its source"""
+    with METRICS.span("fetch", source=source):
+        return func(*args, **kwargs)
 
 
 def get_aggregated_data(coin: str) -> Dict[str, Any]:
-    """Aggregate data from multiple sources for a specific cryptocurrency"""
-    market_data = fetch_market_data(coin)
-    price_data = fetch_price_data(coin)
-    news_data = fetch_crypto_news(coin)
+    """Aggregate data from multiple sources for a specific cryptocurrency
+
+    Market data is resolved once and shared with the price and news fetches,
+    which all run concurrently, so latency tracks the slowest source rather
+    than the sum of them. Sources that miss their deadline come back empty.
+    The price trend comes from the local price history, with no API call.
+    """
+    start = time.monotonic()
+    deadlines = {source: start + limit for source, limit in SOURCE_DEADLINES.items()}
+
+    market_future = _EXECUTOR.submit(_timed, "market", fetch_market_data, coin)
+
+    def shared_market_data() -> Dict[str, Any]:
+        return _await(market_future, deadlines["market"], "market", {})
+
+    def price_job() -> Dict[str, Any]:
+        # Known symbols do not need to wait for CoinGecko at all
+        if _known_binance_symbol(coin):
+            return fetch_price_data(coin)
+        return fetch_price_data(coin, market_data=shared_market_data())
+
+    def news_job() -> List[Dict[str, Any]]:
+        return fetch_crypto_news(coin, market_data=shared_market_data())
+
+    price_future = _EXECUTOR.submit(_timed, "price", price_job)
+    news_future = _EXECUTOR.submit(_timed, "news", news_job)
 
     return {
-        "market_data": market_data,
-        "price_data": price_data,
-        "news_data": news_data
-    }
\ No newline at end of file
+        "market_data": shared_market_data(),
+        "price_data": _await(price_future, deadlines["price"], "price", {}),
+        "news_data": _await(news_future, deadlines["news"], "news", []),
+        "history_data": PRICE_HISTORY.trend(coin)
+    }
+
+
+def get_comparison_data(coins: List[str]) -> Dict[str, Any]:
+    """Aggregate data for several cryptocurrencies in one batched pass
+
+    All coins share one markets snapshot, one batched Binance call and one
+    news feed download, fetched concurrently, so the upstream cost barely
+    grows with the number of coins compared. Descriptions are skipped since
+    comparisons do not use them.
+    """
+    start = time.monotonic()
+    deadlines = {source: start + limit for source, limit in SOURCE_DEADLINES.items()}
+
+    market_future = _EXECUTOR.submit(
+        _timed, "market", lambda: {coin: fetch_market_data(coin, include_profile=False) for coin in coins})
+    price_future = _EXECUTOR.submit(_timed, "price", fetch_prices_batch, coins)
+    news_future = _EXECUTOR.submit(_timed, "news", fetch_news_index)
+
+    market_data = _await(market_future, deadlines["market"], "market", {})
+    prices = _await(price_future, deadlines["price"], "price", {})
+    news_index = _await(news_future, deadlines["news"], "news", None)
+
+    rows = []
+    for coin in coins:
+        coin_market_data = market_data.get(coin) or {}
+        news = []
+        if news_index is not None and coin_market_data:
+            news = news_index.search([coin_market_data["symbol"], coin_market_data["name"]], limit=2)
+        rows.append({
+            "coin": coin,
+            "market_data": coin_market_data,
+            "price_data": prices.get(coin, {}),
+            "news_data": news
+        })
+
+    return {"coins": rows}
@@ -0,0 +1,273 @@
+import asyncio
+import contextlib
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from starlette.applications import Starlette
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
+from starlette.requests import Request
+from starlette.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.routing import Route
+
+from api_handlers import start_live_prices
+from assistant import collect_data
+from db import save_qa_to_db, start_ensure_indexes, write_queue
+from http_client import provider_health
+from llm_handler import stream_answer, warm_up
+from metrics import METRICS
+from refresher import start_refresher
+
+# Headless HTTP API over the same pipeline as the Streamlit app, for other
+# clients and load tests. Run with: python api_server.py
+# or: uvicorn api_server:app --host 0.0.0.0 --port 8000
+API_HOST = os.getenv("API_HOST", "0.0.0.0")
+API_PORT = int(os.getenv("API_PORT", "8000"))
+
+# Worker threads for the blocking pipeline (data fetches and LLM streams)
+API_THREADS = int(os.getenv("API_THREADS", "40"))
+
+# LLM generations running at once; one Ollama server gets slower for every
+# extra concurrent generation, so the rest wait in a bounded queue
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "2"))
+LLM_QUEUE_LIMIT = int(os.getenv("LLM_QUEUE_LIMIT", "32"))  # waiting requests before answering 503
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "30"))  # seconds to wait for a slot
+
+MAX_QUESTION_LENGTH = 1000
+
+
+class Overloaded(Exception):
+    """Raised when a request cannot get an LLM slot; answered with 503"""
+
+
+class LLMGate:
+    """Limits concurrent LLM generations, queueing a bounded number of callers
+
+    A request arriving to a full queue, or waiting longer than the timeout,
+    is rejected right away so a burst sheds load instead of piling up.
+    Answers served from the answer cache do not need a slot.
+    """
+
+    def __init__(self, limit: int = LLM_CONCURRENCY, queue_limit: int = LLM_QUEUE_LIMIT,
+                 timeout: float = LLM_QUEUE_TIMEOUT):
+        self.limit = limit
+        self.queue_limit = queue_limit
+        self.timeout = timeout
+        self.active = 0
+        self.queued = 0
+        self._semaphore = asyncio.Semaphore(limit)
+
+    def check(self):
+        """Raise Overloaded if a new caller would find the queue full"""
+        if self._semaphore.locked() and self.queued >= self.queue_limit:
+            METRICS.increment("api_rejected", reason="queue_full")
+            raise Overloaded("Too many questions are waiting for the LLM, please retry shortly")
+
+    async def acquire(self):
+        self.check()
+        self.queued += 1
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            METRICS.increment("api_rejected", reason="queue_timeout")
+            raise Overloaded(f"No LLM slot became free within {self.timeout:g} seconds")
+        finally:
+            self.queued -= 1
+        METRICS.observe("llm_queue_wait", time.perf_counter() - start)
+        self.active += 1
+
+    def release(self):
+        self.active -= 1
+        self._semaphore.release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"limit": self.limit, "active": self.active, "queued": self.queued,
+                "queue_limit": self.queue_limit}
+
+    def gauges(self):
+        return [("api_llm_active", {}, self.active), ("api_llm_queued", {}, self.queued)]
+
+
+GATE = LLMGate()
+METRICS.add_collector(GATE.gauges)
+
+
+def _error(status: int, message: str, headers: Optional[Dict[str, str]] = None) -> JSONResponse:
+    return JSONResponse({"error": message}, status_code=status, headers=headers)
+
+
+def _overloaded(e: Overloaded) -> JSONResponse:
+    return _error(503, str(e), headers={"Retry-After": "5"})
+
+
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def _read_question(request: Request) -> Tuple[str, Optional[str]]:
+    """Return (question, session_id) from a JSON body, raising ValueError if invalid"""
+    try:
+        body = await request.json()
+    except Exception:
+        raise ValueError("Request body must be JSON")
+    question = body.get("question") if isinstance(body, dict) else None
+    if not isinstance(question, str) or not question.strip():
+        raise ValueError("A non-empty \"question\" string is required")
+    if len(question) > MAX_QUESTION_LENGTH:
+        raise ValueError(f"Questions are limited to {MAX_QUESTION_LENGTH} characters")
+    return question.strip(), body.get("session_id")
+
+
+def _prepare(question: str, cancel_event: threading.Event):
+    """Gather the data and start an answer; the LLM is called once tokens are read"""
+    coins, data = collect_data(question)
+    return coins, stream_answer(question, data, cancel_event)
+
+
+async def ask(request: Request) -> JSONResponse:
+    """POST /ask: answer a question as one JSON document
+
+    Answers 502 with the error message when the LLM fails or times out.
+    """
+    try:
+        question, session_id = await _read_question(request)
+        GATE.check()
+    except ValueError as e:
+        return _error(400, str(e))
+    except Overloaded as e:
+        return _overloaded(e)
+
+    start = time.perf_counter()
+    cancel_event = threading.Event()
+    with METRICS.span("api_request", endpoint="ask"):
+        coins, response = await run_in_threadpool(_prepare, question, cancel_event)
+        if not response["cached"]:
+            try:
+                await GATE.acquire()
+            except Overloaded as e:
+                return _overloaded(e)
+        try:
+            answer = "".join(await run_in_threadpool(list, response["tokens"])).strip()
+        except asyncio.CancelledError:
+            cancel_event.set()
+            raise
+        finally:
+            if not response["cached"]:
+                GATE.release()
+        if response["error"]:
+            # The LLM failed or timed out; the answer is its error message
+            METRICS.increment("api_llm_errors")
+            return _error(502, answer)
+        save_qa_to_db(question, answer, response["sources"], session_id=session_id)
+
+    return JSONResponse({
+        "question": question,
+        "answer": answer,
+        "coins": coins,
+        "sources": response["sources"],
+        "cached": response["cached"],
+        "elapsed_ms": round((time.perf_counter() - start) * 1000, 1)
+    })
+
+
+async def ask_stream(request: Request):
+    """POST /ask/stream: answer a question as server-sent events
+
+    Sends a "meta" event with the coins and sources, one "token" event per
+    generated chunk and a final "done" event with the whole answer. A queue
+    timeout or an LLM failure after the stream has started ends it with an
+    "error" event instead, and nothing is saved. When the client
+    disconnects, the LLM generation is cancelled.
+    """
+    try:
+        question, session_id = await _read_question(request)
+        GATE.check()
+    except ValueError as e:
+        return _error(400, str(e))
+    except Overloaded as e:
+        return _overloaded(e)
+
+    start = time.perf_counter()
+    cancel_event = threading.Event()
+    coins, response = await run_in_threadpool(_prepare, question, cancel_event)
+
+    async def events():
+        holding = False
+        error = False
+        try:
+            yield _sse("meta", {"coins": coins, "sources": response["sources"], "cached": response["cached"]})
+            if not response["cached"]:
+                try:
+                    await GATE.acquire()
+                    holding = True
+                except Overloaded as e:
+                    error = True
+                    yield _sse("error", {"error": str(e)})
+                    return
+            tokens = []
+            async for token in iterate_in_threadpool(response["tokens"]):
+                if response["error"]:
+                    # This token is the failure message, not part of the answer
+                    error = True
+                    METRICS.increment("api_llm_errors")
+                    yield _sse("error", {"error": token})
+                    return
+                tokens.append(token)
+                yield _sse("token", {"text": token})
+            answer = "".join(tokens).strip()
+            save_qa_to_db(question, answer, response["sources"], session_id=session_id)
+            yield _sse("done", {"answer": answer})
+        except BaseException:
+            error = True
+            raise
+        finally:
+            # Stops the Ollama stream if the client went away mid-answer
+            cancel_event.set()
+            if holding:
+                GATE.release()
+            METRICS.observe("api_request", time.perf_counter() - start, error=error, endpoint="ask_stream")
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+async def health(request: Request) -> JSONResponse:
+    """GET /health: LLM queue state and upstream provider health"""
+    return JSONResponse({"status": "ok", "llm": GATE.stats(), "providers": provider_health()})
+
+
+async def metrics(request: Request) -> PlainTextResponse:
+    """GET /metrics: every metric in the Prometheus text format"""
+    return PlainTextResponse(METRICS.prometheus_text(), media_type="text/plain; version=0.0.4")
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    import anyio.to_thread
+
+    anyio.to_thread.current_default_thread_limiter().total_tokens = API_THREADS
+    # Live price feed and cache refresher are each no-ops unless enabled;
+    # the price feed looks up the top coins, so it starts off the event loop
+    await run_in_threadpool(start_live_prices)
+    start_refresher()
+    start_ensure_indexes()
+    warm_up()
+    yield
+    await run_in_threadpool(write_queue.flush)
+
+
+app = Starlette(routes=[
+    Route("/ask", ask, methods=["POST"]),
+    Route("/ask/stream", ask_stream, methods=["POST"]),
+    Route("/health", health),
+    Route("/metrics", metrics)
+], lifespan=lifespan)
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run(app, host=API_HOST, port=API_PORT)
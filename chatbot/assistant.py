@@ -0,0 +1,37 @@
+from typing import Any, Dict, List, Tuple
+
+from api_handlers import identify_coins, get_aggregated_data, get_comparison_data
+from market_analytics import detect_history_window, get_history_ranking, get_market_summary, is_market_question
+from metrics import METRICS
+
+
+def collect_data(query: str) -> Tuple[List[str], Dict[str, Any]]:
+    """Identify the coins in a query and gather the data to answer it
+
+    Shared by the Streamlit app and the headless API. Several coins get a
+    comparison, one coin its aggregated data and a market-wide question the
+    market summary, plus a ranking from the local price history when it asks
+    about a window other than the last 24h; anything else is answered
+    without data. A requested window the history cannot answer yet is kept
+    as "history_window", so the prompt can say only 24h figures exist.
+    """
+    with METRICS.span("resolve"):
+        coins = identify_coins(query)
+
+    data = {}
+    window = detect_history_window(query)
+    with METRICS.span("aggregate"):
+        if len(coins) > 1:
+            data = get_comparison_data(coins)
+        elif coins:
+            data = get_aggregated_data(coins[0])
+            if window and window not in data.get("history_data", {}):
+                data["history_window"] = window
+        elif is_market_question(query):
+            data = {"market_summary": get_market_summary()}
+            ranking = get_history_ranking(window) if window else {}
+            if ranking:
+                data["history_ranking"] = ranking
+            elif window:
+                data["history_window"] = window
+    return coins, data
@@ -0,0 +1,177 @@
+"""Load benchmark for the headless API
+
+Starts api_server.py with uvicorn against the offline fixture server from
+load_bench.py, or targets an already running server with --url, and sends
+questions from concurrent HTTP clients to /ask, or to /ask/stream with
+--stream. Reports throughput, latency percentiles, time to the first token
+for streams and how many requests were shed with 503.
+
+    python benchmarks/api_bench.py --queries 200 --concurrency 16 --db mongomock
+    python benchmarks/api_bench.py --stream --llm-concurrency 4 --queue-limit 8
+    python benchmarks/api_bench.py --url http://localhost:8000 --queries 100
+"""
+import argparse
+import json
+import os
+import socket
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from load_bench import (  # noqa: E402
+    CHATBOT_DIR, Fixtures, FixtureServer, build_queries, configure_environment, percentile
+)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_api_server(args):
+    """Run api_server in a uvicorn thread of this process and return its URL"""
+    os.environ.update({
+        "LLM_CONCURRENCY": str(args.llm_concurrency),
+        "LLM_QUEUE_LIMIT": str(args.queue_limit),
+        "LLM_QUEUE_TIMEOUT": str(args.queue_timeout)
+    })
+    sys.path.insert(0, CHATBOT_DIR)
+
+    import uvicorn
+    import api_server
+
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(api_server.app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, name="api-server", daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, f"http://127.0.0.1:{port}"
+
+
+_sessions = threading.local()
+
+
+def ask(url, question, stream):
+    """Send one question and return (status, latency, time to first token)"""
+    session = getattr(_sessions, "session", None)
+    if session is None:
+        session = _sessions.session = requests.Session()
+    start = time.perf_counter()
+    first_token = None
+    if not stream:
+        response = session.post(f"{url}/ask", json={"question": question, "session_id": "benchmark"}, timeout=300)
+        return response.status_code, time.perf_counter() - start, None
+
+    status = None
+    with session.post(f"{url}/ask/stream", json={"question": question, "session_id": "benchmark"},
+                      stream=True, timeout=300) as response:
+        status = response.status_code
+        if status != 200:
+            return status, time.perf_counter() - start, None
+        for line in response.iter_lines():
+            if line.startswith(b"event: token") and first_token is None:
+                first_token = time.perf_counter() - start
+            elif line.startswith(b"event: error"):
+                status = "error event"
+    return status, time.perf_counter() - start, first_token
+
+
+def run_benchmark(args):
+    fixtures = Fixtures()
+    fixture_server = server = None
+    url = args.url
+    if url is None:
+        fixture_server = FixtureServer(fixtures, llm_tokens=args.llm_tokens, llm_first_token=args.llm_first_token,
+                                       llm_token_interval=args.llm_token_interval).start()
+        configure_environment(fixture_server.url, args)
+        server, url = start_api_server(args)
+
+    queries = build_queries(fixtures, args.queries)
+    # One question first so imports and the coin index are not counted
+    ask(url, queries[0], args.stream)
+    if fixture_server is not None:
+        from metrics import METRICS
+
+        fixture_server.requests.clear()
+        METRICS.reset()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        results = list(executor.map(lambda question: ask(url, question, args.stream), queries))
+    elapsed = time.perf_counter() - start
+
+    statuses = Counter(str(status) for status, _, _ in results)
+    latencies = sorted(latency for status, latency, _ in results if status == 200)
+    first_tokens = sorted(first for status, _, first in results if status == 200 and first is not None)
+    result = {
+        "settings": {name: value for name, value in vars(args).items() if name != "json"},
+        "queries": len(results),
+        "elapsed_s": round(elapsed, 3),
+        "throughput_qps": round(len(latencies) / elapsed, 2),
+        "statuses": dict(sorted(statuses.items())),
+        "p50_ms": round(percentile(latencies, 0.5) * 1000, 1) if latencies else None,
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 1) if latencies else None,
+        "first_token_p50_ms": round(percentile(first_tokens, 0.5) * 1000, 1) if first_tokens else None,
+        "first_token_p95_ms": round(percentile(first_tokens, 0.95) * 1000, 1) if first_tokens else None
+    }
+    if fixture_server is not None:
+        result["upstream_requests"] = dict(sorted(fixture_server.requests.items()))
+        result["stages"] = METRICS.summary()
+        server.should_exit = True
+        fixture_server.stop()
+    return result
+
+
+def print_report(result):
+    print(f"queries:      {result['queries']} in {result['elapsed_s']} s")
+    print(f"throughput:   {result['throughput_qps']} answers/s")
+    print(f"statuses:     {', '.join(f'{status} x{count}' for status, count in result['statuses'].items())}")
+    print(f"p50 / p99:    {result['p50_ms']} / {result['p99_ms']} ms")
+    if result["first_token_p50_ms"] is not None:
+        print(f"first token:  p50 {result['first_token_p50_ms']} ms  p95 {result['first_token_p95_ms']} ms")
+    if result.get("upstream_requests"):
+        print("\nupstream requests:")
+        for route, count in result["upstream_requests"].items():
+            print(f"  {route:40} {count:>4}")
+    if result.get("stages"):
+        print("\nstages:")
+        for row in result["stages"]:
+            label = row["span"] + "".join(f" {row[name]}" for name in ("endpoint", "source", "provider") if name in row)
+            print(f"  {label:36} n={row['count']:<6d} p50 {row['p50_ms']:8.1f} ms  p95 {row['p95_ms']:8.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load benchmark for the headless API")
+    parser.add_argument("--url", help="benchmark a running server instead of starting one on fixtures")
+    parser.add_argument("--queries", type=int, default=100, help="number of questions to send")
+    parser.add_argument("--concurrency", type=int, default=8, help="concurrent HTTP clients")
+    parser.add_argument("--stream", action="store_true", help="use /ask/stream instead of /ask")
+    parser.add_argument("--llm-concurrency", type=int, default=2, help="LLM_CONCURRENCY for the local server")
+    parser.add_argument("--queue-limit", type=int, default=32, help="LLM_QUEUE_LIMIT for the local server")
+    parser.add_argument("--queue-timeout", type=float, default=30, help="LLM_QUEUE_TIMEOUT for the local server")
+    parser.add_argument("--llm-tokens", type=int, default=40, help="tokens per stub LLM answer")
+    parser.add_argument("--llm-first-token", type=float, default=0.2, help="stub LLM time to first token (s)")
+    parser.add_argument("--llm-token-interval", type=float, default=0.01, help="stub LLM delay per token (s)")
+    parser.add_argument("--db", choices=("mongo", "mongomock"), default="mongo",
+                        help="write answers to MongoDB or to an in-memory mongomock")
+    parser.add_argument("--mongo-uri", help="MongoDB URI for --db mongo (defaults to MONGO_URI)")
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+    args.cold = False
+
+    result = run_benchmark(args)
+    print_report(result)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""Startup and rerun timing for the Streamlit app
+
+Runs main.py under Streamlit's AppTest against the offline fixture server
+from load_bench.py and reports the first run in a fresh process, plain
+reruns, and reruns that re-render an already answered query, checked
+against the targets below.
+
+    python benchmarks/app_bench.py --reruns 50 --db mongomock
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from load_bench import CHATBOT_DIR, Fixtures, FixtureServer, configure_environment, percentile  # noqa: E402
+
+# Targets for a script run that does not answer a new query
+STARTUP_TARGET_MS = 1500  # first run in a fresh process, imports included
+RERUN_TARGET_MS = 100  # p95 of later interactions
+
+
+def timed_run(app):
+    start = time.perf_counter()
+    app.run()
+    if app.exception:
+        raise RuntimeError(app.exception[0].value)
+    return (time.perf_counter() - start) * 1000
+
+
+def report(label, samples, target=None):
+    samples = sorted(samples)
+    line = f"{label:28} p50 {percentile(samples, 0.5):8.1f} ms  p95 {percentile(samples, 0.95):8.1f} ms"
+    if target is not None:
+        line += f"  target {target} ms: {'ok' if percentile(samples, 0.95) <= target else 'MISSED'}"
+    print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure Streamlit startup and rerun time")
+    parser.add_argument("--reruns", type=int, default=30, help="reruns to time after the first run")
+    parser.add_argument("--db", choices=("mongo", "mongomock"), default="mongo",
+                        help="use MongoDB or an in-memory mongomock for chat history")
+    parser.add_argument("--mongo-uri", help="MongoDB URI for --db mongo (defaults to MONGO_URI)")
+    args = parser.parse_args()
+    args.cold = False
+
+    server = FixtureServer(Fixtures(), llm_tokens=5, llm_first_token=0.0, llm_token_interval=0.0).start()
+    configure_environment(server.url, args)
+    sys.path.insert(0, CHATBOT_DIR)
+
+    from streamlit.testing.v1 import AppTest
+
+    app = AppTest.from_file(os.path.join(CHATBOT_DIR, "main.py"), default_timeout=60)
+    report("first run", [timed_run(app)], STARTUP_TARGET_MS)
+    report("rerun", [timed_run(app) for _ in range(args.reruns)], RERUN_TARGET_MS)
+
+    app.text_input[0].input("What's the current price of Bitcoin?")
+    report("first answer", [timed_run(app)])
+    report("rerun with answered query", [timed_run(app) for _ in range(args.reruns)], RERUN_TARGET_MS)
+    server.stop()
+
+
+if __name__ == "__main__":
+    main()
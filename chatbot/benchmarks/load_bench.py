@@ -0,0 +1,359 @@
+"""Offline load benchmark for the query pipeline
+
+Replays recorded CoinGecko, Binance, CoinMarketCap and Coindesk responses
+from a local fixture server, answers with a stub LLM of configurable
+latency, and drives identify_coin -> get_aggregated_data -> generate_answer
+-> save_qa_to_db at the requested concurrency. Reports throughput, latency
+percentiles, upstream request counts and peak traced memory.
+
+    python benchmarks/load_bench.py --queries 200 --concurrency 8
+    python benchmarks/load_bench.py --cold --json before.json
+    python benchmarks/load_bench.py --cold --compare before.json
+
+Refresh the fixtures from the live APIs with --record.
+"""
+import argparse
+import json
+import math
+import os
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+CHATBOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+QUESTION_TEMPLATES = [
+    "What's the current price of {name}?",
+    "Tell me the latest news about {name}",
+    "What's the market cap of {name}?",
+    "How is {name} performing today?",
+    "What is {name} and what is its website?"
+]
+
+# Live endpoints used by --record, with the fixture file each one fills
+RECORD_SOURCES = {
+    "coingecko_markets.json": ("https://api.coingecko.com/api/v3/coins/markets",
+                               {"vs_currency": "usd", "order": "market_cap_desc", "per_page": 50, "page": 1}),
+    "binance_ticker_24hr.json": ("https://api.binance.com/api/v3/ticker/24hr", {}),
+    "coindesk_rss.xml": ("https://www.coindesk.com/arc/outboundfeeds/rss/", {})
+}
+
+
+class Fixtures:
+    """Recorded upstream responses, loaded once"""
+
+    def __init__(self, directory=FIXTURES_DIR):
+        def load(name):
+            with open(os.path.join(directory, name)) as f:
+                return json.load(f)
+
+        self.markets = load("coingecko_markets.json")
+        self.profiles = load("coingecko_coins.json")
+        self.tickers = {ticker["symbol"]: ticker for ticker in load("binance_ticker_24hr.json")}
+        self.cmc_map = load("coinmarketcap_map.json")
+        with open(os.path.join(directory, "coindesk_rss.xml"), "rb") as f:
+            self.rss = f.read()
+
+
+class FixtureServer:
+    """Local HTTP server standing in for every upstream API and for Ollama
+
+    Each upstream lives under its own path prefix, so the base URL settings
+    in api_handlers can point at it. Requests are counted per route.
+    """
+
+    def __init__(self, fixtures, llm_tokens=40, llm_first_token=0.2, llm_token_interval=0.01,
+                 upstream_latency=0.0):
+        self.fixtures = fixtures
+        self.llm_tokens = llm_tokens
+        self.llm_first_token = llm_first_token
+        self.llm_token_interval = llm_token_interval
+        self.upstream_latency = upstream_latency
+        self.requests = Counter()
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+        self._server.handle_error = self._handle_error
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self._server.server_port}"
+
+    def start(self):
+        threading.Thread(target=self._server.serve_forever, name="fixture-server", daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+
+    def _handle_error(self, request, client_address):
+        # Clients closing a finished stream early is expected, not a fixture bug
+        if not isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            ThreadingHTTPServer.handle_error(self._server, request, client_address)
+
+    def count(self, route):
+        with self._lock:
+            self.requests[route] += 1
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, status, body=b"", content_type="application/json", headers=None):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _json(self, data, status=200):
+                self._send(status, json.dumps(data).encode())
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                params = {name: values[0] for name, values in parse_qs(url.query).items()}
+                if server.upstream_latency:
+                    time.sleep(server.upstream_latency)
+
+                if url.path == "/coingecko/coins/markets":
+                    server.count("coingecko /coins/markets")
+                    rows = server.fixtures.markets
+                    if "ids" in params:
+                        ids = set(params["ids"].split(","))
+                        rows = [row for row in rows if row["id"] in ids]
+                    return self._json(rows[:int(params.get("per_page", 100))])
+                if url.path.startswith("/coingecko/coins/"):
+                    server.count("coingecko /coins/{id}")
+                    profile = server.fixtures.profiles.get(url.path.rsplit("/", 1)[-1])
+                    return self._json(profile or {"error": "coin not found"}, 200 if profile else 404)
+                if url.path == "/binance/ticker/24hr":
+                    tickers = server.fixtures.tickers
+                    if "symbol" in params:
+                        server.count("binance /ticker/24hr")
+                        ticker = tickers.get(params["symbol"])
+                        return self._json(ticker or {"code": -1121, "msg": "Invalid symbol."}, 200 if ticker else 400)
+                    if "symbols" in params:
+                        server.count("binance /ticker/24hr (batch)")
+                        symbols = json.loads(params["symbols"])
+                        if any(symbol not in tickers for symbol in symbols):
+                            return self._json({"code": -1121, "msg": "Invalid symbol."}, 400)
+                        return self._json([tickers[symbol] for symbol in symbols])
+                    server.count("binance /ticker/24hr (all)")
+                    return self._json(list(tickers.values()))
+                if url.path == "/coinmarketcap/cryptocurrency/map":
+                    server.count("coinmarketcap /cryptocurrency/map")
+                    return self._json(server.fixtures.cmc_map)
+                if url.path == "/coindesk/rss":
+                    server.count("coindesk /rss")
+                    etag = '"fixture"'
+                    if self.headers.get("If-None-Match") == etag:
+                        return self._send(304, headers={"ETag": etag})
+                    return self._send(200, server.fixtures.rss, "application/rss+xml", {"ETag": etag})
+                self._json({"error": f"no fixture for {url.path}"}, 404)
+
+            def do_POST(self):
+                # Stub of Ollama's streaming /api/generate
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                if urlparse(self.path).path != "/api/generate":
+                    return self._json({"error": "not found"}, 404)
+                server.count("llm /api/generate")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                time.sleep(server.llm_first_token)
+                for i in range(server.llm_tokens):
+                    self._chunk({"response": f"token{i} ", "done": False})
+                    time.sleep(server.llm_token_interval)
+                self._chunk({"response": "", "done": True})
+                self.wfile.write(b"0\r\n\r\n")
+
+            def _chunk(self, data):
+                line = (json.dumps(data) + "\n").encode()
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(line), line))
+                self.wfile.flush()
+
+        return Handler
+
+
+def configure_environment(base_url, args):
+    """Point every upstream and Ollama at the fixture server
+
+    Must run before the chatbot modules are imported, since they read their
+    settings at import time.
+    """
+    os.environ.update({
+        "COINGECKO_API_URL": f"{base_url}/coingecko",
+        "BINANCE_API_URL": f"{base_url}/binance",
+        "COINMARKETCAP_API_URL": f"{base_url}/coinmarketcap",
+        "COINDESK_RSS_URL": f"{base_url}/coindesk/rss",
+        "OLLAMA_HOST": base_url,
+        "CMC_MAP_FILE": os.path.join(tempfile.mkdtemp(prefix="cmc-map-"), "cmc_map.json"),
+        "PRICE_STREAM_ENABLED": "False",
+        "REFRESHER_ENABLED": "False"
+    })
+    # The fixture server has no rate limits; keep the client side out of the way too
+    for provider in ("COINGECKO", "BINANCE", "COINMARKETCAP", "COINDESK"):
+        os.environ.setdefault(f"{provider}_RATE_LIMIT", "1000000")
+    if args.cold:
+        os.environ["ANSWER_CACHE_TTL"] = "0"
+    if args.mongo_uri:
+        os.environ["MONGO_URI"] = args.mongo_uri
+    if args.db == "mongomock":
+        import mongomock
+        import pymongo
+        pymongo.MongoClient = mongomock.MongoClient
+
+
+def build_queries(fixtures, count):
+    """Cycle question templates over the fixture coins"""
+    names = [row["name"] for row in fixtures.markets]
+    return [QUESTION_TEMPLATES[i % len(QUESTION_TEMPLATES)].format(name=names[(i // len(QUESTION_TEMPLATES)) % len(names)])
+            for i in range(count)]
+
+
+def percentile(ordered, fraction):
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def run_benchmark(args):
+    fixtures = Fixtures()
+    server = FixtureServer(fixtures, llm_tokens=args.llm_tokens, llm_first_token=args.llm_first_token,
+                           llm_token_interval=args.llm_token_interval,
+                           upstream_latency=args.upstream_latency).start()
+    configure_environment(server.url, args)
+    sys.path.insert(0, CHATBOT_DIR)
+
+    import api_handlers
+    import db
+    import llm_handler
+    from metrics import METRICS
+
+    def answer(question):
+        start = time.perf_counter()
+        if args.cold:
+            api_handlers.CACHE.invalidate()
+        coin = api_handlers.identify_coin(question)
+        data = api_handlers.get_aggregated_data(coin) if coin else {}
+        response = llm_handler.generate_answer(question, data)
+        if args.db != "off":
+            db.save_qa_to_db(question, response["answer"], response["sources"], session_id="benchmark")
+        return time.perf_counter() - start
+
+    queries = build_queries(fixtures, args.queries)
+    # Resolve the coin index once so import-time work is not counted
+    api_handlers.identify_coin(queries[0])
+    server.requests.clear()
+    METRICS.reset()
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        latencies = sorted(executor.map(answer, queries))
+    if args.db != "off":
+        db.write_queue.flush()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    server.stop()
+
+    return {
+        "settings": {name: value for name, value in vars(args).items() if name not in ("json", "compare", "record")},
+        "queries": len(latencies),
+        "elapsed_s": round(elapsed, 3),
+        "throughput_qps": round(len(latencies) / elapsed, 2),
+        "p50_ms": round(percentile(latencies, 0.5) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+        "max_ms": round(latencies[-1] * 1000, 1),
+        "peak_memory_mb": round(peak / 1024 / 1024, 2),
+        "upstream_requests": dict(sorted(server.requests.items())),
+        "stages": METRICS.summary(),
+        "db_writes": db.get_write_stats() if args.db != "off" else {}
+    }
+
+
+def print_report(result, baseline=None):
+    def delta(key):
+        if not baseline or key not in baseline or not baseline[key]:
+            return ""
+        return f"  ({(result[key] - baseline[key]) / baseline[key]:+.1%} vs baseline)"
+
+    print(f"queries:      {result['queries']} in {result['elapsed_s']} s")
+    for key, label in (("throughput_qps", "throughput"), ("p50_ms", "p50"), ("p99_ms", "p99"),
+                       ("max_ms", "max"), ("peak_memory_mb", "peak memory")):
+        print(f"{label + ':':13} {result[key]}{delta(key)}")
+
+    print("\nupstream requests:")
+    baseline_requests = (baseline or {}).get("upstream_requests", {})
+    for route in sorted(set(result["upstream_requests"]) | set(baseline_requests)):
+        count = result["upstream_requests"].get(route, 0)
+        before = f"  (baseline {baseline_requests.get(route, 0)})" if baseline else ""
+        print(f"  {route:36} {count:6d}{before}")
+
+    print("\nstages:")
+    for row in result["stages"]:
+        label = row["span"] + "".join(f" {row[name]}" for name in ("source", "provider") if name in row)
+        print(f"  {label:36} n={row['count']:<6d} p50 {row['p50_ms']:8.1f} ms  p95 {row['p95_ms']:8.1f} ms")
+
+
+def record_fixtures():
+    """Overwrite the market, ticker and news fixtures with live responses"""
+    import requests
+
+    for name, (url, params) in RECORD_SOURCES.items():
+        response = requests.get(url, params=params, timeout=30)
+        response.raise_for_status()
+        with open(os.path.join(FIXTURES_DIR, name), "wb") as f:
+            f.write(response.content)
+        print(f"Recorded {name} ({len(response.content)} bytes)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline load benchmark for the query pipeline")
+    parser.add_argument("--queries", type=int, default=100, help="number of queries to answer")
+    parser.add_argument("--concurrency", type=int, default=4, help="queries answered in parallel")
+    parser.add_argument("--cold", action="store_true",
+                        help="clear the data caches before each query and disable the answer cache")
+    parser.add_argument("--llm-tokens", type=int, default=40, help="tokens per stub LLM answer")
+    parser.add_argument("--llm-first-token", type=float, default=0.2, help="stub LLM time to first token (s)")
+    parser.add_argument("--llm-token-interval", type=float, default=0.01, help="stub LLM delay per token (s)")
+    parser.add_argument("--upstream-latency", type=float, default=0.0, help="added delay per upstream call (s)")
+    parser.add_argument("--db", choices=("mongo", "mongomock", "off"), default="mongo",
+                        help="write answers to MongoDB, to an in-memory mongomock, or not at all")
+    parser.add_argument("--mongo-uri", help="MongoDB URI for --db mongo (defaults to MONGO_URI)")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--compare", help="show changes against results saved with --json")
+    parser.add_argument("--record", action="store_true", help="refresh fixtures from the live APIs and exit")
+    args = parser.parse_args()
+
+    if args.record:
+        record_fixtures()
+        return
+
+    result = run_benchmark(args)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_report(result, baseline)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
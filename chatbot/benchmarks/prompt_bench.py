@@ -0,0 +1,129 @@
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from llm_handler import build_prompt, estimate_tokens, format_number, get_client  # noqa: E402
+
+# Data snapshot shaped like get_aggregated_data output
+SAMPLE_DATA = {
+    "market_data": {
+        "name": "Bitcoin", "symbol": "BTC", "market_cap_rank": 1, "market_cap_usd": 1.31e12,
+        "volume_24h": 3.2e10, "price_change_24h": 1.84,
+        "description": "Bitcoin is the first successful internet money based on peer-to-peer technology.",
+        "homepage": "http://www.bitcoin.org"
+    },
+    "price_data": {
+        "symbol": "BTCUSDT", "price": 66421.5, "price_change_percent": 1.91, "high_24h": 67010.0,
+        "low_24h": 64850.2, "volume_24h": 21874.3
+    },
+    "news_data": [{
+        "title": f"Bitcoin market update {i}",
+        "url": f"https://www.coindesk.com/markets/2024/05/0{i}/bitcoin-market-update/",
+        "source": "Coindesk",
+        "published_at": "Mon, 06 May 2024 12:00:00 +0000",
+        "description": "Bitcoin traded higher on Monday as investors weighed ETF flows, macro data and "
+                       "the outlook for interest rates ahead of the Federal Reserve's next meeting. " * 2
+    } for i in range(1, 6)]
+}
+
+QUESTIONS = [
+    "What's the current price of Bitcoin?",
+    "Tell me the latest news about Bitcoin",
+    "What's the market cap of Bitcoin?",
+    "How is Bitcoin performing today?",
+    "Что происходит с биткоином?"
+]
+
+
+def legacy_prompt(question, data):
+    """The prompt layout used before section selection, for comparison"""
+    market_data, price_data, news = data["market_data"], data["price_data"], data["news_data"]
+    market_info = f"""
+Name: {market_data['name']}
+Symbol: {market_data['symbol']}
+Market Cap Rank: #{market_data['market_cap_rank']}
+Market Cap: ${format_number(market_data['market_cap_usd'])}
+24h Price Change: {market_data['price_change_24h']}%
+Description: {market_data['description']}
+Website: {market_data['homepage']}
+"""
+    price_info = f"""
+Current Price: ${float(price_data['price']):.2f}
+24h Price Change: {price_data['price_change_percent']}%
+24h High: ${price_data['high_24h']}
+24h Low: ${price_data['low_24h']}
+24h Volume: ${format_number(price_data['volume_24h'])}
+"""
+    news_info = "Latest News:\n"
+    for i, item in enumerate(news[:3], 1):
+        news_info += f"{i}. {item['title']} - {item['source']}\n"
+        news_info += f"   {item['description'][:200]}...\n"
+        news_info += f"   Published: {item['published_at']}\n"
+        news_info += f"   URL: {item['url']}\n\n"
+    return f"""You are an expert cryptocurrency assistant. Answer the user's question based on the real-time data provided below.
+Always respond in the same language the question was asked in. Be concise but thorough, and provide specific data when available.
+
+DATA:
+
+## MARKET DATA
+{market_info}
+
+## PRICE DATA
+{price_info}
+
+## NEWS
+{news_info}
+
+
+USER QUESTION: {question}
+
+ANSWER:"""
+
+
+def time_to_first_token(prompt):
+    """Seconds until the first streamed token, or None if Ollama is unreachable"""
+    stream = get_client().stream(prompt)
+    start = time.perf_counter()
+    try:
+        next(stream)
+        return time.perf_counter() - start
+    except Exception:
+        return None
+    finally:
+        stream.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare prompt size and time-to-first-token")
+    parser.add_argument("--ttft", action="store_true", help="also measure time-to-first-token against Ollama")
+    args = parser.parse_args()
+
+    print(f"{'question':40} {'before':>7} {'after':>7} {'saved':>6}  ttft before/after")
+    totals = [0, 0]
+    for question in QUESTIONS:
+        before = legacy_prompt(question, SAMPLE_DATA)
+        after, _ = build_prompt(question, SAMPLE_DATA)
+        before_tokens, after_tokens = estimate_tokens(before), estimate_tokens(after)
+        totals[0] += before_tokens
+        totals[1] += after_tokens
+
+        ttft = ""
+        if args.ttft:
+            results = [time_to_first_token(prompt) for prompt in (before, after)]
+            ttft = " / ".join(f"{value * 1000:.0f} ms" if value is not None else "n/a" for value in results)
+        saved = 1 - after_tokens / before_tokens
+        print(f"{question[:40]:40} {before_tokens:7d} {after_tokens:7d} {saved:6.0%}  {ttft}")
+
+    print(f"{'total':40} {totals[0]:7d} {totals[1]:7d} {1 - totals[1] / totals[0]:6.0%}")
+
+    start = time.perf_counter()
+    for _ in range(1000):
+        build_prompt(QUESTIONS[0], SAMPLE_DATA)
+    print(f"build_prompt: {(time.perf_counter() - start):.3f} ms per call")
+
+
+if __name__ == "__main__":
+    main()
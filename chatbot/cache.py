@@ -0,0 +1,334 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from functools import wraps
+from typing import Any, Callable, Dict, Hashable, Optional
+
+from cache_backends import CacheBackend, deserialize, serialize
+from metrics import METRICS
+
+# Sentinel for "not in cache", so None and empty values can still be cached
+MISSING = object()
+
+# Cross-replica refresh locks: how long a lock is held at most, and how long
+# other replicas wait for its holder before fetching for themselves
+CACHE_LOCK_TTL = float(os.getenv("CACHE_LOCK_TTL", "30"))
+CACHE_LOCK_WAIT = float(os.getenv("CACHE_LOCK_WAIT", "10"))
+CACHE_LOCK_POLL = 0.1  # seconds between checks while waiting
+
+# Shared entries outlive their TTL by this factor so they can be served stale
+SHARED_RETENTION = 3
+
+
+class TTLCache:
+    """Thread-safe in-memory cache with per-namespace TTLs and LRU eviction
+
+    Entries are keyed by (namespace, key). Each namespace has its own time to
+    live, while max_size bounds the total number of entries across all
+    namespaces; the least recently used entry is evicted first. Expired
+    entries are kept until evicted so they can be served stale.
+
+    With a shared backend (see cache_backends), this in-memory cache acts as
+    a first level in front of it: values are written through to the backend,
+    local misses and expired entries are looked up there, and a cross-replica
+    lock makes only one replica compute a missing key while the others wait
+    for its result. Shared values must be msgpack/JSON-serializable.
+    """
+
+    def __init__(self, ttls: Dict[str, float], max_size: int = 1024, default_ttl: float = 60,
+                 backend: Optional[CacheBackend] = None):
+        self.ttls = dict(ttls)
+        self.max_size = max_size
+        self.default_ttl = default_ttl
+        self.backend = backend
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+        self._stats = {}
+        self._inflight = {}
+
+    def ttl(self, namespace: str) -> float:
+        """Return the time to live for a namespace"""
+        return self.ttls.get(namespace, self.default_ttl)
+
+    def _count(self, namespace: str, counter: str):
+        stats = self._stats.setdefault(namespace, {"hits": 0, "misses": 0, "evictions": 0})
+        stats[counter] = stats.get(counter, 0) + 1
+        METRICS.increment("cache_events", namespace=namespace, event=counter)
+
+    @staticmethod
+    def _shared_key(namespace: str, key: Hashable) -> str:
+        return f"v:{namespace}|{key!r}"
+
+    def _lookup(self, namespace: str, key: Hashable):
+        """Return (value, age) for an entry, fresh or not, or None
+
+        A local entry that is missing or expired is looked up in the shared
+        backend, which another replica may have refreshed.
+        """
+        entry_key = (namespace, key)
+        with self._lock:
+            entry = self._entries.get(entry_key)
+            if entry is not None:
+                self._entries.move_to_end(entry_key)
+                if time.time() - entry[1] < self.ttl(namespace) or self.backend is None:
+                    return entry[0], time.time() - entry[1]
+
+        shared = self._shared_get(namespace, key)
+        if shared is not None and (entry is None or shared[1] > entry[1]):
+            with self._lock:
+                self._count(namespace, "shared_hits")
+            self._store(namespace, key, *shared)
+            entry = shared
+        return (entry[0], time.time() - entry[1]) if entry is not None else None
+
+    def _shared_get(self, namespace: str, key: Hashable):
+        """Return (value, stored_at) from the shared backend, or None"""
+        if self.backend is None:
+            return None
+        try:
+            payload = self.backend.get(self._shared_key(namespace, key))
+            if payload is None:
+                return None
+            stored_at, value = deserialize(payload)
+            return value, stored_at
+        except Exception as e:
+            print(f"Error reading {namespace}/{key} from the shared cache: {e}")
+            return None
+
+    def get(self, namespace: str, key: Hashable, default: Any = MISSING) -> Any:
+        """Return a fresh cached value, or default when missing or expired"""
+        entry = self._lookup(namespace, key)
+        with self._lock:
+            if entry is None or entry[1] >= self.ttl(namespace):
+                self._count(namespace, "misses")
+                return default
+            self._count(namespace, "hits")
+            return entry[0]
+
+    def _store(self, namespace: str, key: Hashable, value: Any, stored_at: float):
+        entry_key = (namespace, key)
+        with self._lock:
+            self._entries[entry_key] = (value, stored_at)
+            self._entries.move_to_end(entry_key)
+            while len(self._entries) > self.max_size:
+                (evicted_namespace, _), _ = self._entries.popitem(last=False)
+                self._count(evicted_namespace, "evictions")
+
+    def set(self, namespace: str, key: Hashable, value: Any):
+        """Store a value, evicting least recently used entries past max_size
+
+        The value is also written to the shared backend, if there is one.
+        """
+        stored_at = time.time()
+        self._store(namespace, key, value, stored_at)
+        if self.backend is None:
+            return
+        try:
+            self.backend.set(self._shared_key(namespace, key), serialize([stored_at, value]),
+                             self.ttl(namespace) * SHARED_RETENTION)
+        except Exception as e:
+            print(f"Error writing {namespace}/{key} to the shared cache: {e}")
+
+    def single_flight(self, namespace: str, key: Hashable, compute: Callable[[], Any]) -> Any:
+        """Run compute for a key at most once at a time
+
+        The first caller runs compute; callers arriving while it is in flight
+        wait for and share its result (or exception) instead of repeating it.
+        With a shared backend the first caller also takes the key's
+        cross-replica lock, waiting up to CACHE_LOCK_WAIT for another replica
+        holding it; compute should then find that replica's result cached.
+        """
+        entry_key = (namespace, key)
+        with self._lock:
+            future = self._inflight.get(entry_key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._inflight[entry_key] = future
+            else:
+                self._count(namespace, "coalesced")
+        if not leader:
+            return future.result()
+
+        token = None
+        try:
+            token = self._acquire_shared(namespace, key)
+            value = compute()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(value)
+            return value
+        finally:
+            if token is not None:
+                self._release_shared(namespace, key, token)
+            with self._lock:
+                self._inflight.pop(entry_key, None)
+
+    def _acquire_shared(self, namespace: str, key: Hashable) -> Optional[str]:
+        """Take the key's cross-replica lock, waiting while another replica holds it
+
+        Returns the lock token, or None when there is no backend or the wait
+        timed out (the caller then computes without the lock).
+        """
+        if self.backend is None:
+            return None
+        name = self._shared_key(namespace, key)
+        deadline = time.monotonic() + CACHE_LOCK_WAIT
+        try:
+            while True:
+                token = self.backend.acquire(name, CACHE_LOCK_TTL)
+                if token is not None:
+                    return token
+                if time.monotonic() >= deadline:
+                    print(f"Timed out waiting for another replica to refresh {namespace}/{key}")
+                    return None
+                with self._lock:
+                    self._count(namespace, "lock_waits")
+                time.sleep(CACHE_LOCK_POLL)
+        except Exception as e:
+            print(f"Error locking {namespace}/{key} in the shared cache: {e}")
+            return None
+
+    def _release_shared(self, namespace: str, key: Hashable, token: str):
+        try:
+            self.backend.release(self._shared_key(namespace, key), token)
+        except Exception as e:
+            print(f"Error unlocking {namespace}/{key} in the shared cache: {e}")
+
+    def claim(self, name: str, seconds: float) -> bool:
+        """Claim a recurring task for `seconds` across replicas
+
+        Returns True if this replica should run the task now. Without a
+        shared backend every claim succeeds. The claim is never released,
+        it simply expires, so one replica runs the task per period.
+        """
+        if self.backend is None:
+            return True
+        try:
+            return self.backend.acquire(f"claim:{name}", seconds) is not None
+        except Exception as e:
+            print(f"Error claiming {name} in the shared cache: {e}")
+            return True
+
+    def _revalidate(self, namespace: str, key: Hashable, compute: Callable[[], Any]):
+        """Refresh a key in a background thread unless a refresh is in flight"""
+        def run():
+            try:
+                self.single_flight(namespace, key, compute)
+            except Exception as e:
+                print(f"Background refresh of {namespace}/{key} failed: {e}")
+
+        with self._lock:
+            if (namespace, key) in self._inflight:
+                return
+        threading.Thread(target=run, name=f"revalidate-{namespace}", daemon=True).start()
+
+    def invalidate(self, namespace: Optional[str] = None, key: Hashable = MISSING):
+        """Drop one key, a whole namespace, or everything when namespace is None"""
+        with self._lock:
+            if namespace is None:
+                self._entries.clear()
+            elif key is not MISSING:
+                self._entries.pop((namespace, key), None)
+            else:
+                for entry_key in [k for k in self._entries if k[0] == namespace]:
+                    del self._entries[entry_key]
+        if self.backend is None:
+            return
+        try:
+            if namespace is None:
+                self.backend.delete_prefix("v:")
+            elif key is not MISSING:
+                self.backend.delete(self._shared_key(namespace, key))
+            else:
+                self.backend.delete_prefix(f"v:{namespace}|")
+        except Exception as e:
+            print(f"Error invalidating the shared cache: {e}")
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """Return hit/miss/eviction counters and current size per namespace"""
+        with self._lock:
+            stats = {namespace: dict(counters) for namespace, counters in self._stats.items()}
+            for namespace, _ in self._entries:
+                stats.setdefault(namespace, {"hits": 0, "misses": 0, "evictions": 0})
+                stats[namespace]["size"] = stats[namespace].get("size", 0) + 1
+            return stats
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def cached(self, namespace: str, key: Optional[Callable[..., Hashable]] = None,
+               cache_empty: bool = False, stale_while_revalidate: float = 0):
+        """Decorator caching a function's results in a namespace
+
+        key builds the cache key from the call arguments and defaults to the
+        positional and keyword arguments themselves. Empty results (failed
+        fetches) are not cached unless cache_empty is set. Concurrent misses
+        for the same key are coalesced into a single call. With
+        stale_while_revalidate, an entry expired for less than that many
+        seconds is returned immediately while one background call refreshes
+        it. The wrapped function gains a refresh() method that bypasses and
+        repopulates the cache.
+        """
+        def decorator(func):
+            def make_key(*args, **kwargs):
+                if key is not None:
+                    return key(*args, **kwargs)
+                return args + tuple(sorted(kwargs.items()))
+
+            def store(cache_key, value):
+                if value or cache_empty:
+                    self.set(namespace, cache_key, value)
+                return value
+
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                cache_key = make_key(*args, **kwargs)
+
+                def compute():
+                    # A caller that just finished may have filled the cache
+                    entry = self._lookup(namespace, cache_key)
+                    if entry is not None and entry[1] < self.ttl(namespace):
+                        return entry[0]
+                    return store(cache_key, func(*args, **kwargs))
+
+                # Looked up outside the lock, which may read the shared backend
+                entry = self._lookup(namespace, cache_key)
+                with self._lock:
+                    ttl = self.ttl(namespace)
+                    if entry is not None and entry[1] < ttl:
+                        self._count(namespace, "hits")
+                        return entry[0]
+                    if entry is not None and entry[1] < ttl + stale_while_revalidate:
+                        self._count(namespace, "stale")
+                    else:
+                        entry = None
+                        self._count(namespace, "misses")
+
+                if entry is not None:
+                    self._revalidate(namespace, cache_key, compute)
+                    return entry[0]
+                return self.single_flight(namespace, cache_key, compute)
+
+            def refresh(*args, **kwargs):
+                cache_key = make_key(*args, **kwargs)
+                requested = time.time()
+
+                def compute():
+                    # Another replica may have refreshed it while we waited for its lock
+                    entry = self._lookup(namespace, cache_key)
+                    if entry is not None and self.backend is not None and time.time() - entry[1] >= requested:
+                        return entry[0]
+                    return store(cache_key, func(*args, **kwargs))
+
+                return self.single_flight(namespace, cache_key, compute)
+
+            wrapper.refresh = refresh
+            return wrapper
+
+        return decorator
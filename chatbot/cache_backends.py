@@ -0,0 +1,197 @@
+import json
+import os
+import re
+import uuid
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta
+from typing import Any, Optional
+
+# Shared cache backend: "memory" keeps every replica's cache to itself,
+# "redis" or "mongo" share cached data and refresh locks between replicas
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+CACHE_KEY_PREFIX = os.getenv("CACHE_KEY_PREFIX", "crypto:")
+
+# Serialization formats, tagged by the first byte of each stored payload so
+# replicas with different libraries installed can still read each other
+_FORMATS = {}
+try:
+    import msgpack
+    _FORMATS[b"m"] = (lambda value: msgpack.packb(value, use_bin_type=True),
+                      lambda payload: msgpack.unpackb(payload, raw=False))
+except ImportError:
+    pass
+try:
+    import orjson
+    _FORMATS[b"o"] = (orjson.dumps, orjson.loads)
+except ImportError:
+    pass
+_FORMATS[b"j"] = (lambda value: json.dumps(value, separators=(",", ":")).encode(), json.loads)
+
+# Preferred format: msgpack, then orjson, then the standard library
+_WRITE_FORMAT = next(tag for tag in (b"m", b"o", b"j") if tag in _FORMATS)
+
+
+def serialize(value: Any) -> bytes:
+    """Encode a cached value with the most compact available format"""
+    return _WRITE_FORMAT + _FORMATS[_WRITE_FORMAT][0](value)
+
+
+def deserialize(payload: bytes) -> Any:
+    """Decode a value written by serialize() on any replica"""
+    tag, body = payload[:1], payload[1:]
+    if tag not in _FORMATS:
+        raise ValueError(f"cannot decode cache payload format {tag!r}")
+    return _FORMATS[tag][1](body)
+
+
+class CacheBackend(ABC):
+    """Storage shared between replicas, used behind TTLCache
+
+    Values are opaque bytes that expire after ttl seconds. Locks are leases:
+    acquire returns a token when the caller now holds the named lock for up
+    to ttl seconds, or None when another holder has it.
+    """
+
+    name = "base"
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[bytes]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def set(self, key: str, payload: bytes, ttl: float):
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete(self, key: str):
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete_prefix(self, prefix: str):
+        raise NotImplementedError
+
+    @abstractmethod
+    def acquire(self, name: str, ttl: float) -> Optional[str]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def release(self, name: str, token: str):
+        raise NotImplementedError
+
+
+class RedisBackend(CacheBackend):
+    """Shared cache in Redis, with SET NX leases for locks"""
+
+    name = "redis"
+
+    # Delete a lock only if it still holds our token
+    _RELEASE_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+    def __init__(self, url: str = REDIS_URL):
+        import redis
+
+        self.client = redis.Redis.from_url(url, socket_timeout=2, socket_connect_timeout=2)
+        self._release = self.client.register_script(self._RELEASE_SCRIPT)
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.client.get(CACHE_KEY_PREFIX + key)
+
+    def set(self, key: str, payload: bytes, ttl: float):
+        self.client.set(CACHE_KEY_PREFIX + key, payload, px=max(1, int(ttl * 1000)))
+
+    def delete(self, key: str):
+        self.client.delete(CACHE_KEY_PREFIX + key)
+
+    def delete_prefix(self, prefix: str):
+        keys = list(self.client.scan_iter(match=f"{CACHE_KEY_PREFIX}{prefix}*", count=500))
+        if keys:
+            self.client.delete(*keys)
+
+    def acquire(self, name: str, ttl: float) -> Optional[str]:
+        token = uuid.uuid4().hex
+        if self.client.set(f"{CACHE_KEY_PREFIX}lock:{name}", token, nx=True, px=max(1, int(ttl * 1000))):
+            return token
+        return None
+
+    def release(self, name: str, token: str):
+        self._release(keys=[f"{CACHE_KEY_PREFIX}lock:{name}"], args=[token])
+
+
+class MongoBackend(CacheBackend):
+    """Shared cache in the app's MongoDB, with TTL indexes for expiry"""
+
+    name = "mongo"
+
+    def __init__(self):
+        from db import get_database
+
+        database = get_database()
+        self.entries = database["cache_entries"]
+        self.locks = database["cache_locks"]
+        # MongoDB drops expired documents in the background (about once a
+        # minute), so reads check expires_at as well
+        self.entries.create_index("expires_at", name="expires_at_ttl", expireAfterSeconds=0)
+        self.locks.create_index("expires_at", name="expires_at_ttl", expireAfterSeconds=0)
+
+    def get(self, key: str) -> Optional[bytes]:
+        document = self.entries.find_one({"_id": CACHE_KEY_PREFIX + key, "expires_at": {"$gt": datetime.utcnow()}})
+        return bytes(document["payload"]) if document else None
+
+    def set(self, key: str, payload: bytes, ttl: float):
+        self.entries.replace_one(
+            {"_id": CACHE_KEY_PREFIX + key},
+            {"payload": payload, "expires_at": datetime.utcnow() + timedelta(seconds=ttl)},
+            upsert=True
+        )
+
+    def delete(self, key: str):
+        self.entries.delete_one({"_id": CACHE_KEY_PREFIX + key})
+
+    def delete_prefix(self, prefix: str):
+        self.entries.delete_many({"_id": {"$regex": "^" + re.escape(CACHE_KEY_PREFIX + prefix)}})
+
+    def acquire(self, name: str, ttl: float) -> Optional[str]:
+        from pymongo.errors import DuplicateKeyError
+
+        lock_id = CACHE_KEY_PREFIX + name
+        token = uuid.uuid4().hex
+        now = datetime.utcnow()
+        lock = {"token": token, "expires_at": now + timedelta(seconds=ttl)}
+        try:
+            self.locks.insert_one(dict(lock, _id=lock_id))
+            return token
+        except DuplicateKeyError:
+            pass
+        # Take over a lease that expired but was not cleaned up yet
+        taken = self.locks.find_one_and_update({"_id": lock_id, "expires_at": {"$lte": now}}, {"$set": lock})
+        return token if taken else None
+
+    def release(self, name: str, token: str):
+        self.locks.delete_one({"_id": CACHE_KEY_PREFIX + name, "token": token})
+
+
+def create_backend(name: str = CACHE_BACKEND) -> Optional[CacheBackend]:
+    """Create the configured shared backend, or None for the in-memory cache
+
+    Falls back to the in-memory cache, with a message, if the backend's
+    client library is missing or the server cannot be reached.
+    """
+    if name == "memory":
+        return None
+    backends = {"redis": RedisBackend, "mongo": MongoBackend}
+    if name not in backends:
+        print(f"Unknown CACHE_BACKEND {name!r}, using the in-memory cache")
+        return None
+    try:
+        backend = backends[name]()
+        backend.get("ping")
+        return backend
+    except Exception as e:
+        print(f"Error connecting to the {name} cache backend, using the in-memory cache: {e}")
+        return None
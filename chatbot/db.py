@@ -1,26 +1,299 @@
-from pymongo import MongoClient
-from datetime import datetime
-import os
-
-# MongoDB connection
-MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017")
-client = MongoClient(MONGO_URI)
-db = client["crypto_ai"]
-qa_collection = db["chat_history"]
-
-def save_qa_to_db(question, answer, sources=None):
-    """Save question-answer pair to database"""
-    qa_collection.insert_one({
-        "question": question,
-        "answer": answer,
-        "sources": sources if sources else [],
-        "timestamp": datetime.utcnow()
-    })
-
-def get_chat_history(limit=10):
-    """Get recent chat history"""
-    return list(qa_collection.find().sort("timestamp", -1).limit(limit))
-
-def clear_database():
-    """Clear all chat history"""
-    qa_collection.delete_many({})
\ No newline at end of file
+from datetime import datetime
+import atexit
+import os
+import queue
+import threading
+import time
+
+from metrics import METRICS
+
+# MongoDB connection
+MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017")
+MONGO_DATABASE = "crypto_ai"
+
+# Sort directions, as in pymongo
+ASCENDING = 1
+DESCENDING = -1
+
+# Write-behind settings
+DB_BACKEND = os.getenv("DB_BACKEND", "pymongo")  # "pymongo" or "motor"
+DB_BATCH_SIZE = int(os.getenv("DB_BATCH_SIZE", "50"))
+DB_FLUSH_INTERVAL = float(os.getenv("DB_FLUSH_INTERVAL", "2"))  # seconds
+DB_QUEUE_SIZE = int(os.getenv("DB_QUEUE_SIZE", "10000"))
+DB_MAX_RETRIES = int(os.getenv("DB_MAX_RETRIES", "5"))  # retries of a failed record before it is dropped
+
+# MongoDB duplicate key error, reported for records a retried batch already inserted
+DUPLICATE_KEY_ERROR = 11000
+
+# Chat history retention in days (0 keeps history forever)
+CHAT_HISTORY_TTL_DAYS = int(os.getenv("CHAT_HISTORY_TTL_DAYS", "30"))
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Return the shared MongoClient, importing pymongo and creating it on first use"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            from pymongo import MongoClient
+            _client = MongoClient(MONGO_URI)
+        return _client
+
+
+def get_database():
+    return get_client()[MONGO_DATABASE]
+
+
+def get_collection():
+    """Return the chat history collection"""
+    return get_database()["chat_history"]
+
+
+def ensure_indexes():
+    """Create the chat history indexes; safe to call on every startup"""
+    qa_collection = get_collection()
+    # Per-session history reads, newest first, with _id as keyset tie-breaker
+    qa_collection.create_index([("session_id", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)],
+                               name="session_timestamp")
+    if CHAT_HISTORY_TTL_DAYS > 0:
+        qa_collection.create_index("timestamp", name="timestamp_ttl",
+                                   expireAfterSeconds=CHAT_HISTORY_TTL_DAYS * 24 * 60 * 60)
+
+
+def start_ensure_indexes():
+    """Create the indexes from a daemon thread, so startup never waits on MongoDB"""
+    def run():
+        try:
+            ensure_indexes()
+        except Exception as e:
+            print(f"Error creating chat history indexes: {e}")
+
+    threading.Thread(target=run, name="ensure-indexes", daemon=True).start()
+
+
+def _pymongo_writer(records):
+    get_collection().insert_many(records, ordered=False)
+
+
+def _motor_writer():
+    """Build a writer backed by motor, running its own event loop in the flush thread"""
+    import asyncio
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    state = {}
+
+    def write(records):
+        # Created lazily so the loop and client belong to the flush thread;
+        # motor looks the loop up as the thread's current one
+        if not state:
+            state["loop"] = asyncio.new_event_loop()
+            asyncio.set_event_loop(state["loop"])
+            state["collection"] = AsyncIOMotorClient(MONGO_URI)[MONGO_DATABASE]["chat_history"]
+        state["loop"].run_until_complete(state["collection"].insert_many(records, ordered=False))
+
+    return write
+
+
+class _Clear:
+    """Queue item asking the worker to drop records it has not written yet"""
+
+    def __init__(self, match):
+        self.match = match
+        self.done = threading.Event()
+
+
+class WriteBehindQueue:
+    """Queue records and insert them in batches from a background thread
+
+    A batch is flushed when it reaches batch_size records or when
+    flush_interval seconds pass, whichever comes first. Records of a failed
+    batch are retried with the next flush, up to max_retries times. When a
+    bulk insert fails part way, only the records it did not insert are
+    retried; duplicate key errors mean a record is already stored.
+    """
+
+    def __init__(self, writer, batch_size=DB_BATCH_SIZE, flush_interval=DB_FLUSH_INTERVAL,
+                 max_size=DB_QUEUE_SIZE, label="chat records", max_retries=DB_MAX_RETRIES):
+        self.writer = writer
+        self.label = label
+        self.max_retries = max_retries
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max_size)
+        self._retry = []  # (record, failed attempts) pairs
+        self._lock = threading.Lock()
+        self._stats = {"enqueued": 0, "written": 0, "batches": 0, "failures": 0, "dropped": 0,
+                       "last_flush_ms": 0.0, "last_error": ""}
+        self._thread = threading.Thread(target=self._run, name="db-write-behind", daemon=True)
+        self._thread.start()
+
+    def put(self, record):
+        """Queue a record without waiting for the database"""
+        try:
+            self._queue.put(record, timeout=1)
+        except queue.Full:
+            # Backpressure: the worker is far behind, so write inline instead
+            self.writer([record])
+        with self._lock:
+            self._stats["enqueued"] += 1
+
+    def flush(self, timeout=10):
+        """Write everything queued so far and wait until it is done"""
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def clear(self, match=None, timeout=10):
+        """Drop records that have not been written yet and wait until it is done
+
+        match optionally selects which records to drop; the rest stay queued.
+        The worker does the dropping, so records it already took off the
+        queue into its pending batch are dropped too.
+        """
+        request = _Clear(match)
+        self._queue.put(request)
+        return request.done.wait(timeout)
+
+    def _drop(self, batch, match):
+        """Return the records of batch to keep, dropping retried ones as well"""
+        with self._lock:
+            if match is None:
+                self._retry = []
+            else:
+                self._retry = [(record, attempts) for record, attempts in self._retry if not match(record)]
+        if match is None:
+            return []
+        return [record for record in batch if not match(record)]
+
+    def stats(self):
+        """Return queue depth and flush metrics"""
+        with self._lock:
+            return dict(self._stats, queue_depth=self._queue.qsize() + len(self._retry))
+
+    @staticmethod
+    def _unwritten(batch, error):
+        """Return the indexes of batch still to retry after a failed write
+
+        A BulkWriteError lists the records it could not insert; the others,
+        and those rejected as duplicates, are stored. Any other error may
+        have happened before anything was written, so all are retried.
+        """
+        details = getattr(error, "details", None)
+        if not isinstance(details, dict) or "writeErrors" not in details:
+            return range(len(batch))
+        return sorted({write_error["index"] for write_error in details["writeErrors"]
+                       if write_error.get("code") != DUPLICATE_KEY_ERROR})
+
+    def _write(self, batch):
+        with self._lock:
+            pending = self._retry + [(record, 0) for record in batch]
+            self._retry = []
+        if not pending:
+            return
+        batch = [record for record, _ in pending]
+        start = time.perf_counter()
+        try:
+            self.writer(batch)
+        except Exception as e:
+            METRICS.observe("db_write", time.perf_counter() - start, error=True)
+            print(f"Error writing {len(batch)} {self.label}: {e}")
+            unwritten = self._unwritten(batch, e)
+            retry = [(pending[i][0], pending[i][1] + 1) for i in unwritten]
+            kept = [item for item in retry if item[1] <= self.max_retries]
+            if len(kept) < len(retry):
+                print(f"Dropping {len(retry) - len(kept)} {self.label} after {self.max_retries} failed retries")
+            with self._lock:
+                self._stats["failures"] += 1
+                self._stats["last_error"] = str(e)
+                self._stats["written"] += len(batch) - len(retry)
+                self._stats["dropped"] += len(retry) - len(kept)
+                self._retry = kept[-self._queue.maxsize:]
+            return
+        METRICS.observe("db_write", time.perf_counter() - start)
+        with self._lock:
+            self._stats["written"] += len(batch)
+            self._stats["batches"] += 1
+            self._stats["last_flush_ms"] = round((time.perf_counter() - start) * 1000, 2)
+
+    def _run(self):
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            try:
+                item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                item = None
+
+            if isinstance(item, threading.Event):
+                self._write(batch)
+                batch = []
+                item.set()
+            elif isinstance(item, _Clear):
+                batch = self._drop(batch, item.match)
+                item.done.set()
+                continue
+            elif item is not None:
+                batch.append(item)
+                if len(batch) < self.batch_size:
+                    continue
+                self._write(batch)
+                batch = []
+            elif time.monotonic() >= deadline:
+                self._write(batch)
+                batch = []
+            else:
+                continue
+            deadline = time.monotonic() + self.flush_interval
+
+
+write_queue = WriteBehindQueue(_motor_writer() if DB_BACKEND == "motor" else _pymongo_writer)
+
+# Flush queued records on interpreter shutdown
+atexit.register(write_queue.flush)
+
+
+def save_qa_to_db(question, answer, sources=None, session_id=None):
+    """Queue a question-answer pair for saving to the database"""
+    write_queue.put({
+        "session_id": session_id,
+        "question": question,
+        "answer": answer,
+        "sources": sources if sources else [],
+        "timestamp": datetime.utcnow()
+    })
+
+
+def get_chat_history(session_id=None, limit=10, before=None):
+    """Get recent chat history for a session, newest first
+
+    Pass the last record of a page as before to get the next (older) page.
+    Pages are selected by (timestamp, _id) rather than skip, so deep pages
+    cost the same as the first one.
+    """
+    write_queue.flush()
+    query = {"session_id": session_id}
+    if before is not None:
+        query["$or"] = [
+            {"timestamp": {"$lt": before["timestamp"]}},
+            {"timestamp": before["timestamp"], "_id": {"$lt": before["_id"]}}
+        ]
+    cursor = get_collection().find(query).sort([("timestamp", DESCENDING), ("_id", DESCENDING)])
+    return list(cursor.limit(limit))
+
+
+def get_write_stats():
+    """Get write-behind queue depth and flush metrics"""
+    return write_queue.stats()
+
+
+def clear_database(session_id=None):
+    """Clear chat history for one session, or for everyone when session_id is None"""
+    if session_id is None:
+        write_queue.clear()
+        get_collection().delete_many({})
+    else:
+        write_queue.clear(lambda record: record.get("session_id") == session_id)
+        get_collection().delete_many({"session_id": session_id})
@@ -0,0 +1,194 @@
+import os
+import random
+import threading
+import time
+from typing import Any, Dict, Optional
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import METRICS
+
+# Timeouts (seconds) for every upstream call
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "3.05"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "10"))
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "10"))
+
+# Retry and circuit breaker settings
+HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "2"))
+HTTP_BACKOFF_BASE = 0.5  # seconds, doubled per attempt
+HTTP_BACKOFF_MAX = 10  # longest single wait, including Retry-After
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_RESET_AFTER = float(os.getenv("BREAKER_RESET_AFTER", "30"))  # seconds
+
+# Requests (Binance: request weight) per minute allowed for each provider
+PROVIDER_RATE_LIMITS = {
+    "coingecko": float(os.getenv("COINGECKO_RATE_LIMIT", "30")),  # free tier
+    "binance": float(os.getenv("BINANCE_RATE_LIMIT", "5000")),  # of 6000 weight
+    "coinmarketcap": float(os.getenv("COINMARKETCAP_RATE_LIMIT", "30")),
+    "coindesk": float(os.getenv("COINDESK_RATE_LIMIT", "30"))
+}
+
+# Status codes worth retrying: rate limited, IP ban warning, server errors
+RETRY_STATUSES = {418, 429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(requests.RequestException):
+    """Raised instead of calling a provider whose circuit breaker is open"""
+
+
+class TokenBucket:
+    """Rate limiter allowing `rate` requests per minute with bursts up to `capacity`"""
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate / 60.0
+        self.capacity = capacity if capacity is not None else max(1.0, rate / 6.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1.0):
+        """Block until the requested tokens are available"""
+        tokens = min(tokens, self.capacity)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait = (tokens - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class ProviderClient:
+    """HTTP client for one upstream provider
+
+    Keeps one pooled session per provider host, applies connect/read
+    timeouts and the provider's rate limit, retries throttled or failed
+    calls with jittered exponential backoff (honouring Retry-After), and
+    opens a circuit breaker after repeated failures so a dead provider
+    fails fast instead of blocking every query.
+    """
+
+    def __init__(self, name: str, rate_per_minute: float):
+        self.name = name
+        self.bucket = TokenBucket(rate_per_minute)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=HTTP_POOL_SIZE)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._last_error = ""
+        self._stats = {}
+
+    def _record(self, endpoint: str, elapsed: float, error: bool = False, retry: bool = False):
+        METRICS.observe("upstream", elapsed, error=error, provider=self.name)
+        with self._lock:
+            stats = self._stats.setdefault(endpoint, {"requests": 0, "errors": 0, "retries": 0,
+                                                      "total_ms": 0.0})
+            stats["requests"] += 1
+            stats["errors"] += int(error)
+            stats["retries"] += int(retry)
+            stats["total_ms"] += elapsed * 1000
+
+    def _check_breaker(self):
+        with self._lock:
+            if self._opened_at is None:
+                return
+            if time.monotonic() - self._opened_at < BREAKER_RESET_AFTER:
+                raise CircuitOpenError(f"{self.name} circuit open after {self._failures} failures: "
+                                       f"{self._last_error}")
+            # Half-open: let this call through as a trial
+            self._opened_at = time.monotonic()
+
+    def _success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+
+    def _failure(self, error: str):
+        with self._lock:
+            self._failures += 1
+            self._last_error = error
+            if self._failures >= BREAKER_FAILURE_THRESHOLD:
+                self._opened_at = time.monotonic()
+
+    @staticmethod
+    def _backoff(attempt: int, response: Optional[requests.Response] = None) -> float:
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), HTTP_BACKOFF_MAX)
+        return random.uniform(0, min(HTTP_BACKOFF_BASE * 2 ** attempt, HTTP_BACKOFF_MAX))
+
+    def get(self, url: str, endpoint: str = None, weight: float = 1, **kwargs) -> requests.Response:
+        """GET a URL with rate limiting, timeouts, retries and circuit breaking
+
+        endpoint names the call in the stats (defaults to the URL path) and
+        weight is how many rate limit tokens it costs. Responses other than
+        retryable errors are returned as-is for the caller to check.
+        """
+        endpoint = endpoint or urlparse(url).path
+        kwargs.setdefault("timeout", (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT))
+        self._check_breaker()
+
+        for attempt in range(HTTP_MAX_RETRIES + 1):
+            self.bucket.acquire(weight)
+            start = time.perf_counter()
+            response = None
+            try:
+                response = self.session.get(url, **kwargs)
+                error = f"HTTP {response.status_code}" if response.status_code in RETRY_STATUSES else ""
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = str(e)
+                if attempt == HTTP_MAX_RETRIES:
+                    self._record(endpoint, time.perf_counter() - start, error=True, retry=attempt > 0)
+                    self._failure(error)
+                    raise
+
+            self._record(endpoint, time.perf_counter() - start, error=bool(error), retry=attempt > 0)
+            if not error:
+                self._success()
+                return response
+            if attempt == HTTP_MAX_RETRIES:
+                self._failure(error)
+                return response
+            time.sleep(self._backoff(attempt, response))
+
+    def health(self) -> Dict[str, Any]:
+        """Return circuit breaker state and per-endpoint request counts"""
+        with self._lock:
+            if self._opened_at is None:
+                state = "closed"
+            elif time.monotonic() - self._opened_at < BREAKER_RESET_AFTER:
+                state = "open"
+            else:
+                state = "half-open"
+            return {
+                "state": state,
+                "consecutive_failures": self._failures,
+                "last_error": self._last_error,
+                "endpoints": {endpoint: dict(stats) for endpoint, stats in self._stats.items()}
+            }
+
+
+PROVIDERS = {name: ProviderClient(name, rate) for name, rate in PROVIDER_RATE_LIMITS.items()}
+
+
+def provider_health() -> Dict[str, Dict[str, Any]]:
+    """Return health and request stats for every provider"""
+    return {name: client.health() for name, client in PROVIDERS.items()}
+
+
+def _breaker_gauges():
+    states = ("closed", "half-open", "open")
+    return [("provider_circuit_state", {"provider": name}, states.index(health["state"]))
+            for name, health in provider_health().items()]
+
+
+# Exported as 0 closed, 1 half-open, 2 open
+METRICS.add_collector(_breaker_gauges)
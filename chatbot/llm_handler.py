@@ -1,117 +1,405 @@
 import os
 import json
+import re
+import math
+import threading
+import time
+from typing import Iterator, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from answer_cache import ANSWER_CACHE
+from metrics import METRICS
 
 # Set the model name - can be changed to your preferred model
-OLLAMA_MODEL = "llama3"
+OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "llama3")
 
+# Local Ollama server settings
+OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://localhost:11434")
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")  # keep the model loaded between questions
+OLLAMA_CONNECT_TIMEOUT = float(os.getenv("OLLAMA_CONNECT_TIMEOUT", "3"))
+OLLAMA_READ_TIMEOUT = float(os.getenv("OLLAMA_READ_TIMEOUT", "30"))  # max silence between tokens
+OLLAMA_POOL_SIZE = int(os.getenv("OLLAMA_POOL_SIZE", "4"))
 
-def generate_answer(question, data):
+
+class OllamaClient:
+    """Long-lived client for the Ollama HTTP API with a pooled connection"""
+
+    def __init__(self, host: str = OLLAMA_HOST, model: str = OLLAMA_MODEL,
+                 keep_alive: str = OLLAMA_KEEP_ALIVE):
+        self.host = host.rstrip("/")
+        self.model = model
+        self.keep_alive = keep_alive
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=OLLAMA_POOL_SIZE)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def stream(self, prompt: str, cancel_event: Optional[threading.Event] = None) -> Iterator[str]:
+        """Yield response tokens as the server produces them
+
+        Setting cancel_event, or closing the generator, drops the connection,
+        which makes Ollama stop generating.
+        """
+        payload = {
+            "model": self.model,
+            "prompt": prompt,
+            "stream": True,
+            "keep_alive": self.keep_alive
+        }
+        with self.session.post(f"{self.host}/api/generate", json=payload, stream=True,
+                               timeout=(OLLAMA_CONNECT_TIMEOUT, OLLAMA_READ_TIMEOUT)) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if cancel_event is not None and cancel_event.is_set():
+                    break
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                if chunk.get("error"):
+                    raise RuntimeError(chunk["error"])
+                if chunk.get("response"):
+                    yield chunk["response"]
+                if chunk.get("done"):
+                    break
+
+    def generate(self, prompt: str, cancel_event: Optional[threading.Event] = None) -> str:
+        """Return the full completion for a prompt"""
+        return "".join(self.stream(prompt, cancel_event)).strip()
+
+    def warm_up(self):
+        """Load the model into memory without generating anything"""
+        payload = {"model": self.model, "keep_alive": self.keep_alive}
+        self.session.post(f"{self.host}/api/generate", json=payload,
+                          timeout=(OLLAMA_CONNECT_TIMEOUT, OLLAMA_READ_TIMEOUT)).raise_for_status()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> OllamaClient:
+    """Return the shared Ollama client, creating it on first use"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = OllamaClient()
+        return _client
+
+
+def warm_up():
+    """Load the model in a background thread so the first question does not wait for it"""
+    def run():
+        try:
+            get_client().warm_up()
+        except Exception as e:
+            print(f"Error warming up the LLM: {e}")
+
+    threading.Thread(target=run, name="llm-warm-up", daemon=True).start()
+
+
+# Fixed instructions placed first in every prompt. Keeping this prefix
+# byte-identical between calls lets Ollama reuse its KV cache for it.
+SYSTEM_PROMPT = """You are an expert cryptocurrency assistant. Answer the user's question based on the real-time data provided below.
+Always respond in the same language the question was asked in. Be concise but thorough, and provide specific data when available.
+
+"""
+
+# Approximate token budget for the DATA block of the prompt
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "400"))
+
+# Question keywords (regular expressions) that select each data section
+INTENT_KEYWORDS = {
+    "price": (r"price\w*", "cost", "worth", "value", "trading at", "how much", "high", "low", "usd",
+              r"perform\w*", r"chang\w*", "today", "up", "down", "pump", "dump", r"compar\w*"),
+    "trend": (r"perform\w*", r"trend\w*", "week", "weekly", "month", "monthly", r"histor\w*",
+              "over time", r"volatil\w*", "since", r"rall\w*", "gain", "gains", "lose", "losing"),
+    "market": ("market cap", "marketcap", "capitalization", "rank", "volume", "dominance",
+               r"perform\w*", r"compar\w*", "supply"),
+    "news": ("news", "latest", r"headlines?", r"happen\w*", "why", r"announce\w*", r"updates?"),
+    "about": ("what is", "project", "website", "explain", "who", "use case", "technology")
+}
+INTENT_PATTERNS = {
+    intent: re.compile(r"(?<!\w)(?:" + "|".join(keywords) + r")(?!\w)")
+    for intent, keywords in INTENT_KEYWORDS.items()
+}
+SECTIONS = ("price", "trend", "market", "news", "about")
+
+
+def detect_intents(question):
+    """Return the data sections a question needs; all of them if unclear"""
+    question = question.lower()
+    intents = {intent for intent, pattern in INTENT_PATTERNS.items() if pattern.search(question)}
+    return intents or set(SECTIONS)
+
+
+def estimate_tokens(text):
+    """Rough token count for llama-style tokenizers (about 4 characters per token)"""
+    return (len(text) + 3) // 4
+
+
+def _price_section(price_data):
+    return "\n".join([
+        "## PRICE DATA (Binance)",
+        f"Current Price: {format_price(price_data.get('price'))}",
+        f"24h Price Change: {price_data.get('price_change_percent', 'N/A')}%",
+        f"24h High: ${price_data.get('high_24h', 'N/A')}",
+        f"24h Low: ${price_data.get('low_24h', 'N/A')}",
+        f"24h Volume: ${format_number(price_data.get('volume_24h', 0))}"
+    ])
+
+
+def _missing_history_line(window):
+    return f"No {window} history available; figures given are 24h."
+
+
+def _trend_section(history, missing_window=None):
+    lines = ["## PRICE TREND (local history)"]
+    for window, stats in history.items():
+        lines.append(f"{window}: {stats['return_pct']:+.2f}% (volatility {stats['volatility_pct']}%, "
+                     f"range {format_price(stats['low'])} - {format_price(stats['high'])})")
+    if missing_window:
+        lines.append(_missing_history_line(missing_window))
+    return "\n".join(lines)
+
+
+def _market_section(market_data, include_change):
+    lines = [
+        "## MARKET DATA (CoinGecko)",
+        f"Market Cap Rank: #{market_data.get('market_cap_rank', 'N/A')}",
+        f"Market Cap: ${format_number(market_data.get('market_cap_usd', 0))}",
+        f"24h Trading Volume: ${format_number(market_data.get('volume_24h', 0))}"
+    ]
+    if include_change:
+        lines.append(f"24h Price Change: {market_data.get('price_change_24h', 'N/A')}%")
+    return "\n".join(lines)
+
+
+def _about_section(market_data):
+    return "\n".join([
+        "## ABOUT",
+        f"Description: {market_data.get('description') or 'N/A'}",
+        f"Website: {market_data.get('homepage') or 'N/A'}"
+    ])
+
+
+def _news_section(news, budget):
+    """Add news items one at a time while they fit in the token budget"""
+    lines = ["## NEWS (Coindesk)"]
+    used = estimate_tokens(lines[0])
+    for i, item in enumerate(news[:3], 1):  # Limit to top 3 news
+        entry = f"{i}. {item.get('title', 'N/A')} ({item.get('published_at', 'N/A')})"
+        description = item.get("description", "")
+        if description:
+            entry += f"\n   {description[:160]}{'...' if len(description) > 160 else ''}"
+        cost = estimate_tokens(entry)
+        if used + cost > budget:
+            break
+        lines.append(entry)
+        used += cost
+    return "\n".join(lines) if len(lines) > 1 else ""
+
+
+def _comparison_section(coins):
+    """One table row per coin, so several coins cost about as much as one"""
+    lines = [
+        "## COMPARISON (Binance, CoinGecko)",
+        "Coin | Price | 24h Change | Market Cap | Rank | 24h Volume"
+    ]
+    for row in coins:
+        market_data, price_data = row["market_data"], row["price_data"]
+        name = f"{market_data.get('name', row['coin'])} ({market_data.get('symbol', 'N/A')})"
+        price = price_data.get("price") or market_data.get("current_price")
+        change = price_data.get("price_change_percent", market_data.get("price_change_24h"))
+        lines.append(" | ".join([
+            name,
+            format_price(price),
+            f"{change}%" if change is not None else "N/A",
+            f"${format_number(market_data.get('market_cap_usd'))}",
+            f"#{market_data.get('market_cap_rank', 'N/A')}",
+            f"${format_number(market_data.get('volume_24h'))}"
+        ]))
+    return "\n".join(lines)
+
+
+def _comparison_news_section(coins, budget):
+    """Add each coin's headlines while they fit in the token budget"""
+    lines = ["## NEWS (Coindesk)"]
+    used = estimate_tokens(lines[0])
+    for row in coins:
+        for item in row["news_data"]:
+            entry = f"- [{row['market_data'].get('symbol', row['coin'])}] {item.get('title', 'N/A')}"
+            cost = estimate_tokens(entry)
+            if used + cost > budget:
+                break
+            lines.append(entry)
+            used += cost
+    return "\n".join(lines) if len(lines) > 1 else ""
+
+
+def _build_comparison_context(coins, intents, budget):
+    """Build the DATA block and sources for a multi-coin comparison"""
+    blocks = [_comparison_section(coins)]
+    used = estimate_tokens(blocks[0])
+    sources = ["Binance"] if any(row["price_data"] for row in coins) else []
+    sources.append("CoinGecko")
+    if "news" in intents:
+        news_block = _comparison_news_section(coins, budget - used)
+        if news_block:
+            blocks.append(news_block)
+            sources.append("Coindesk")
+    return blocks, sources
+
+
+def _market_summary_section(summary):
+    """Market-wide rankings from one markets snapshot"""
+    def movers(rows):
+        return ", ".join(f"{row['symbol']} {row['price_change_24h']:+.2f}%" for row in rows)
+
+    lines = [
+        f"## MARKET OVERVIEW (CoinGecko, top {summary['coins']} coins)",
+        f"Total Market Cap: ${format_number(summary['total_market_cap'])}",
+        f"Total 24h Volume: ${format_number(summary['total_volume_24h'])}",
+        f"24h Breadth: {summary['advancers']} up, {summary['decliners']} down, "
+        f"median change {summary['median_change_24h']}%",
+        f"Top Gainers (24h): {movers(summary['gainers'])}",
+        f"Top Losers (24h): {movers(summary['losers'])}",
+        "Volume Leaders: " + ", ".join(f"{row['symbol']} ${format_number(row['volume_24h'])}"
+                                       for row in summary["volume_leaders"]),
+        "Market Cap Share: " + ", ".join(f"{row['symbol']} {row['market_cap_share']:.1f}%"
+                                         for row in summary["market_cap_share"])
+    ]
+    return "\n".join(lines)
+
+
+def _history_ranking_section(ranking):
+    """Best and worst performers over a window of the local price history"""
+    def performers(rows):
+        return ", ".join(f"{row['coin']} {row['return_pct']:+.2f}%" for row in rows)
+
+    return "\n".join([
+        f"## PERFORMANCE OVER {ranking['window'].upper()} (local price history)",
+        f"Best: {performers(ranking['best'])}",
+        f"Worst: {performers(ranking['worst'])}"
+    ])
+
+
+def build_prompt(question, data, intents=None, budget=PROMPT_TOKEN_BUDGET):
     """
-    Generate a comprehensive answer using the LLM based on
-    cryptocurrency data from different sources
+    Build the LLM prompt from cryptocurrency data from different sources
+
+    Only the sections the question asks about are included (see
+    detect_intents), in priority order, while they fit in the token budget.
+    The 24h change is listed once, preferring Binance over CoinGecko.
 
     Parameters:
     - question: User's query about cryptocurrency
-    - data: Dictionary containing market data, price data, and news
+    - data: Dictionary containing market data, price data, and news, a
+      "coins" list of those for a comparison (see get_comparison_data), or
+      a "market_summary" (and optionally a "history_ranking") for
+      market-wide questions; "history_window" names a requested window the
+      local price history does not cover yet
+    - intents: Sections to include; detected from the question by default
+    - budget: Approximate token budget for the data block, None for no limit
 
     Returns:
-    - Generated answer from the LLM and sources information
+    - Tuple of the prompt text and the list of sources used
     """
     # Extract relevant information from data
     market_data = data.get("market_data", {})
     price_data = data.get("price_data", {})
     news = data.get("news_data", [])
+    history = data.get("history_data", {})
+    missing_window = data.get("history_window")
+    intents = detect_intents(question) if intents is None else set(intents)
+    budget = budget if budget is not None else float("inf")
 
-    # Format market data for the prompt
-    market_info = ""
-    if market_data:
-        market_info = f"""
-Name: {market_data.get('name', 'N/A')}
-Symbol: {market_data.get('symbol', 'N/A')}
-Market Cap Rank: #{market_data.get('market_cap_rank', 'N/A')}
-Market Cap: ${format_number(market_data.get('market_cap_usd', 0))}
-24h Price Change: {market_data.get('price_change_24h', 'N/A')}%
-Description: {market_data.get('description', 'N/A')}
-Website: {market_data.get('homepage', 'N/A')}
-"""
+    blocks = []
+    sources = []
+    if data.get("market_summary"):
+        blocks, sources = [_market_summary_section(data["market_summary"])], ["CoinGecko"]
+        if data.get("history_ranking"):
+            blocks.append(_history_ranking_section(data["history_ranking"]))
+        elif missing_window:
+            blocks.append(_missing_history_line(missing_window))
+        intents = set()
+    elif data.get("coins"):
+        blocks, sources = _build_comparison_context(data["coins"], intents, budget)
+        intents = set()  # the comparison table replaces the single-coin sections
+    elif market_data:
+        blocks.append(f"Coin: {market_data.get('name', 'N/A')} ({market_data.get('symbol', 'N/A')})")
+    used = sum(estimate_tokens(block) for block in blocks)
 
-    # Format price data for the prompt
-    price_info = ""
-    if price_data:
-        price_info = f"""
-Current Price: ${float(price_data.get('price', 0)):.2f}
-24h Price Change: {price_data.get('price_change_percent', 'N/A')}%
-24h High: ${price_data.get('high_24h', 'N/A')}
-24h Low: ${price_data.get('low_24h', 'N/A')}
-24h Volume: ${format_number(price_data.get('volume_24h', 0))}
-"""
+    for section in SECTIONS:
+        if section not in intents:
+            continue
+        if section == "price" and price_data:
+            block, source = _price_section(price_data), "Binance"
+        elif section == "trend" and (history or missing_window):
+            block, source = _trend_section(history, missing_window), None
+        elif section == "market" and market_data:
+            block, source = _market_section(market_data, include_change=not price_data), "CoinGecko"
+        elif section == "about" and market_data:
+            block, source = _about_section(market_data), "CoinGecko"
+        elif section == "news" and news:
+            block, source = _news_section(news, budget - used), "Coindesk"
+        elif section == "news":
+            block, source = "## NEWS\nNo recent news available.", None
+        else:
+            continue
 
-    # Format news data for the prompt
-    news_info = ""
-    if news:
-        news_info = "Latest News:\n"
-        for i, item in enumerate(news[:3], 1):  # Limit to top 3 news
-            news_info += f"{i}. {item.get('title', 'N/A')} - {item.get('source', 'N/A')}\n"
-            if item.get('description'):
-                news_info += f"   {item.get('description')[:200]}...\n"
-            news_info += f"   Published: {item.get('published_at', 'N/A')}\n"
-            news_info += f"   URL: {item.get('url', 'N/A')}\n\n"
-    else:
-        news_info = "No recent news available.\n"
-
-    # Create the full context
-    context = f"""
-## MARKET DATA
-{market_info}
-
-## PRICE DATA
-{price_info}
-
-## NEWS
-{news_info}
-"""
+        cost = estimate_tokens(block)
+        if not block or used + cost > budget:
+            continue
+        blocks.append(block)
+        used += cost
+        if source and source not in sources:
+            sources.append(source)
 
-    # Create the prompt for the LLM
-    prompt = f"""You are an expert cryptocurrency assistant. Answer the user's question based on the real-time data provided below.
-Always respond in the same language the question was asked in. Be concise but thorough, and provide specific data when available.
+    context = "\n\n".join(blocks) if blocks else "No data available."
 
-DATA:
+    # Create the prompt for the LLM
+    prompt = f"""{SYSTEM_PROMPT}DATA:
 {context}
 
 USER QUESTION: {question}
 
 ANSWER:"""
 
-    # Track which sources were used
-    sources = []
-    if market_data:
-        sources.append("CoinGecko")
-    if price_data:
-        sources.append("Binance")
-    if news:
-        sources.append("Coindesk")
+    return prompt, sources
+
+
+def generate_answer(question, data):
+    """
+    Generate a comprehensive answer using the LLM based on
+    cryptocurrency data from different sources
+
+    Parameters:
+    - question: User's query about cryptocurrency
+    - data: Dictionary containing market data, price data, and news
 
-    sources_text = f"\n\nИсточники данных: {', '.join(sources)}" if sources else ""
+    Returns:
+    - Generated answer from the LLM and sources information
+    """
+    cached = ANSWER_CACHE.get(question, data)
+    if cached is not None:
+        return cached
+
+    with METRICS.span("prompt_build"):
+        prompt, sources = build_prompt(question, data)
 
     try:
-        # Use Ollama for inference
-        import subprocess
-        result = subprocess.run(
-            ["ollama", "run", OLLAMA_MODEL],
-            input=prompt.encode(),
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            timeout=30
-        )
-        response = result.stdout.decode("utf-8").strip()
-
-        # Add sources to the response
-        return {
-            "answer": response,
+        with METRICS.span("llm_generate"):
+            answer = get_client().generate(prompt)
+        response = {
+            "answer": answer,
             "sources": sources
         }
+        ANSWER_CACHE.set(question, data, response)
+        return response
 
-    except subprocess.TimeoutExpired:
+    except requests.Timeout:
         return {
             "answer": "⚠️ Response timed out. Please try again with a simpler question.",
             "sources": []
@@ -123,6 +411,89 @@ ANSWER:"""
         }
 
 
+def stream_answer(question, data, cancel_event=None):
+    """
+    Stream an answer token by token as the LLM generates it
+
+    Returns:
+    - Dictionary with a "tokens" generator, the "sources" list, whether
+      the answer came from the answer cache ("cached") without an LLM call,
+      and "error", which is set once the tokens are consumed if generation
+      failed and the tokens are an error message rather than an answer
+    """
+    cached = ANSWER_CACHE.get(question, data)
+    if cached is not None:
+        return {
+            "tokens": iter([cached["answer"]]),
+            "sources": cached["sources"],
+            "cached": True,
+            "error": False
+        }
+
+    with METRICS.span("prompt_build"):
+        prompt, sources = build_prompt(question, data)
+
+    def on_complete(answer):
+        if not (cancel_event is not None and cancel_event.is_set()):
+            ANSWER_CACHE.set(question, data, {"answer": answer, "sources": sources})
+
+    def on_error():
+        response["error"] = True
+
+    response = {
+        "tokens": _stream_tokens(prompt, cancel_event, on_complete, on_error),
+        "sources": sources,
+        "cached": False,
+        "error": False
+    }
+    return response
+
+
+def _stream_tokens(prompt, cancel_event=None, on_complete=None, on_error=None):
+    """Yield tokens from the shared client, turning failures into a message
+
+    on_complete receives the full answer once the stream finishes cleanly;
+    on_error is called before the failure message is yielded.
+    Time to the first token and the whole generation are recorded as spans.
+    """
+    start = time.perf_counter()
+    error = False
+    try:
+        tokens = []
+        for token in get_client().stream(prompt, cancel_event):
+            if not tokens:
+                METRICS.observe("llm_first_token", time.perf_counter() - start)
+            tokens.append(token)
+            yield token
+        if on_complete is not None:
+            on_complete("".join(tokens).strip())
+    except requests.Timeout:
+        error = True
+        if on_error is not None:
+            on_error()
+        yield "⚠️ Response timed out. Please try again with a simpler question."
+    except Exception as e:
+        error = True
+        if on_error is not None:
+            on_error()
+        yield f"⚠️ Error generating response: {e}"
+    finally:
+        METRICS.observe("llm_generate", time.perf_counter() - start, error=error)
+
+
+def format_price(price):
+    """Format a USD price, keeping significant digits for sub-dollar coins"""
+    try:
+        price = float(price)
+    except (TypeError, ValueError):
+        return "N/A"
+    if price >= 1 or price <= 0:
+        return f"${price:.2f}"
+    # Two decimals would show SHIB or PEPE as $0.00; keep four significant
+    # digits in fixed notation instead, e.g. $0.00001234
+    return f"${price:.{3 - math.floor(math.log10(price))}f}"
+
+
 def format_number(num):
     """Format large numbers for better readability"""
     try:
@@ -1,9 +1,21 @@
-import streamlit as st
-from api_handlers import identify_coin, get_aggregated_data, get_top_coins
-from llm_handler import generate_answer
-from db import save_qa_to_db, get_chat_history, clear_database
 import time
-import pandas as pd
+import uuid
+
+import streamlit as st
+from config import DATA_CACHE_TIME
+from api_handlers import CACHE, get_top_coins, fetch_prices_batch, start_live_prices
+from assistant import collect_data
+from llm_handler import get_client as get_llm_client, stream_answer, warm_up
+from refresher import start_refresher
+from http_client import PROVIDERS, provider_health
+from answer_cache import ANSWER_CACHE
+from metrics import METRICS, start_metrics_server
+from db import save_qa_to_db, get_chat_history, clear_database, start_ensure_indexes
+
+# Script runs are timed as the "app_run" span; benchmarks/app_bench.py
+# checks them against the startup and rerun targets
+run_start = time.perf_counter()
+run_state = {"answered": False}
 
 st.set_page_config(page_title="AI Crypto Assistant", layout="wide")
 
@@ -14,80 +26,230 @@ st.title("""
 """)
 st.write("Ask any question about the top 50 cryptocurrencies by market cap.")
 
+
+@st.cache_resource
+def init_resources():
+    """Create the shared clients and start background services once per process"""
+    # Live price feed, cache refresher and /metrics are each no-ops unless enabled
+    start_live_prices()
+    start_refresher()
+    start_metrics_server()
+    # Creating the Mongo client and its indexes waits on the server, so it
+    # happens off the script thread and never delays the first page
+    start_ensure_indexes()
+    # Load the model while the first page renders
+    warm_up()
+    return {"llm": get_llm_client(), "http": PROVIDERS}
+
+
+init_resources()
+
 # Initialize session state
+if "session_id" not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex
+
 if "chat_history" not in st.session_state:
     st.session_state.chat_history = []
 
 if "clear_triggered" not in st.session_state:
     st.session_state.clear_triggered = False
 
-# Sidebar with top coins info
-with st.sidebar:
+# Results of answered queries, keyed on the query text, so reruns caused by
+# widget clicks render from them instead of repeating the whole pipeline
+if "query_results" not in st.session_state:
+    st.session_state.query_results = {}
+
+# Last text submitted in the query box; reruns with the same text are not new questions
+if "last_input" not in st.session_state:
+    st.session_state.last_input = ""
+
+MAX_QUERY_RESULTS = 20
+
+# Namespaces of api_handlers.CACHE behind the top coins table
+MARKET_NAMESPACES = ("markets", "top_coins", "market", "price")
+
+
+@st.cache_data(ttl=CACHE.ttl("price"), show_spinner=False)
+def top_coins_table():
+    """Rows for the top 20 coins table, rebuilt at most once per price TTL"""
+    top_coins = get_top_coins()[:20]
+    # Get price data for display in one batched call
+    prices = fetch_prices_batch([coin["id"] for coin in top_coins])
+    return [{
+        "Rank": coin["market_cap_rank"],
+        "Symbol": coin["symbol"].upper(),
+        "Name": coin["name"],
+        "Price": prices.get(coin["id"], {}).get("price"),
+        "24h %": prices.get(coin["id"], {}).get("price_change_percent")
+    } for coin in top_coins]
+
+
+@st.fragment
+def top_coins_panel():
+    """Top coins table; Refresh reruns only this fragment"""
     st.header("Top Cryptocurrencies")
-    # Add refresh button
     if st.button("🔄 Refresh Market Data"):
-        st.cache_data.clear()
+        for namespace in MARKET_NAMESPACES:
+            CACHE.invalidate(namespace)
+        top_coins_table.clear()
 
-    # Display top coins table
     try:
-        top_coins = get_top_coins(20)  # Get top 20 coins
-        if top_coins:
-            # Get price data for display
-            df = pd.DataFrame([{
-                "Rank": coin["market_cap_rank"],
-                "Symbol": coin["symbol"].upper(),
-                "Name": coin["name"]
-            } for coin in top_coins])
-
-            st.dataframe(df, hide_index=True)
+        rows = top_coins_table()
+        if rows:
+            st.dataframe(rows, hide_index=True)
     except Exception as e:
         st.error(f"Error loading top coins: {e}")
 
-    # Display system status
+
+def system_status_panel():
+    """Provider health and latency from the live metrics"""
     st.subheader("System Status")
-    st.write("✅ CoinGecko API: Connected")
-    st.write("✅ Binance API: Connected")
-    st.write("✅ CoinMarketCap API: Connected")
-    st.write("✅ Coindesk RSS: Connected")
+    provider_names = {"coingecko": "CoinGecko API", "binance": "Binance API",
+                      "coinmarketcap": "CoinMarketCap API", "coindesk": "Coindesk RSS"}
+    state_icons = {"closed": "✅", "half-open": "⚠️", "open": "❌"}
+    latency = {row["provider"]: row for row in METRICS.summary("upstream")}
+    for provider, health in provider_health().items():
+        line = f"{state_icons[health['state']]} {provider_names.get(provider, provider)}"
+        if provider in latency:
+            line += f": p50 {latency[provider]['p50_ms']:.0f} ms, p95 {latency[provider]['p95_ms']:.0f} ms"
+        else:
+            line += ": no requests yet"
+        st.write(line)
+        if health["state"] != "closed" and health["last_error"]:
+            st.caption(health["last_error"])
+
+    answer_stats = ANSWER_CACHE.stats()
+    st.write(f"💬 Answer cache: {answer_stats['hit_rate']:.0%} hit rate, "
+             f"{answer_stats['hits'] + answer_stats['similar_hits']} hits, {answer_stats['misses']} misses")
+
+    stages = [row for row in METRICS.summary() if row["span"] != "upstream"]
+    if stages:
+        st.caption("Query stage latency (ms)")
+        st.dataframe([{
+            "Stage": row["span"] + "".join(f" ({row[label]})" for label in ("source", "kind") if label in row),
+            "Count": row["count"],
+            "p50": row["p50_ms"],
+            "p95": row["p95_ms"]
+        } for row in stages], hide_index=True)
+
+
+# Sidebar with top coins info
+with st.sidebar:
+    top_coins_panel()
+    system_status_panel()
 
     # Clear database button
     if st.button("🗑️ Clear Chat History"):
-        clear_database()
+        clear_database(st.session_state.session_id)
         st.session_state.chat_history = []
         st.success("Chat history cleared.")
         st.session_state.clear_triggered = True
 
 # Function to process user query
-def process_query(query):
-    if query and not st.session_state.clear_triggered:
-        # Show spinner while processing
-        with st.spinner("Processing your query..."):
-            # Identify coin in the query (if any)
-            coin = identify_coin(query)
-            
-            # Get data from APIs if a coin was identified
-            data = {}
-            if coin:
-                data = get_aggregated_data(coin)
-            
-            # Generate answer
-            response = generate_answer(query, data)
-            answer = response["answer"]
-            sources = response["sources"]
-
-            # Display answer
-            st.markdown(f"**AI Assistant:** {answer}")
-
-            # Display sources if available
-            if sources:
-                source_text = ", ".join(sources)
-                st.markdown(f"**Источники данных:** {source_text}")
-
-            # Save to database
-            save_qa_to_db(query, answer)
-
-            # Add to session history
-            st.session_state.chat_history.append((query, answer, sources))
+def process_query(query, submitted=True):
+    """Answer a query once per session and return its result
+
+    The result holds the resolved coins, the aggregated data, the answer and
+    its sources. Queries naming several coins are answered from one batched
+    comparison pass. It is kept in st.session_state, so reruns caused by
+    other widgets (submitted=False) reuse it instead of re-running
+    resolution, aggregation and the LLM. Only a new submission of the same
+    query after DATA_CACHE_TIME seconds answers it again.
+    """
+    if not query or st.session_state.clear_triggered:
+        return None
+
+    results = st.session_state.query_results
+    result = results.get(query)
+    if result and (not submitted or time.time() - result["created_at"] < DATA_CACHE_TIME):
+        return result
+    if not submitted:
+        return None
+
+    run_state["answered"] = True
+
+    # Show spinner while processing
+    with st.spinner("Processing your query..."), METRICS.span("query"):
+        # Identify coins in the query (if any) and get their data from APIs
+        coins, data = collect_data(query)
+
+        # Generate answer, rendering tokens as they arrive. A rerun stops
+        # the script mid-loop, which closes the stream and cancels generation.
+        response = stream_answer(query, data)
+        sources = response["sources"]
+        answer_placeholder = st.empty()
+        answer = ""
+        for token in response["tokens"]:
+            answer += token
+            answer_placeholder.markdown(f"**AI Assistant:** {answer}▌")
+        answer_placeholder.empty()
+
+        result = {
+            "query": query,
+            "coins": coins,
+            "data": data,
+            "answer": answer.strip(),
+            "sources": sources,
+            "created_at": time.time()
+        }
+
+        # A failed generation is shown once but not kept, so asking again retries the LLM
+        if response["error"]:
+            return result
+
+        # Save to database
+        save_qa_to_db(query, result["answer"], sources, session_id=st.session_state.session_id)
+
+        # Add to session history
+        st.session_state.chat_history.append((query, result["answer"], sources))
+
+    results.pop(query, None)
+    results[query] = result
+    while len(results) > MAX_QUERY_RESULTS:
+        results.pop(next(iter(results)))
+    return result
+
+
+def render_result(result):
+    """Render the answer, sources and news panels of a query result"""
+    if not result:
+        return
+
+    # Display answer
+    st.markdown(f"**AI Assistant:** {result['answer']}")
+
+    # Display sources if available
+    if result["sources"]:
+        source_text = ", ".join(result["sources"])
+        st.markdown(f"**Источники данных:** {source_text}")
+
+    # Display market-wide rankings if available
+    summary = result["data"].get("market_summary")
+    if summary:
+        gainers_col, losers_col = st.columns(2)
+        for column, title, key in ((gainers_col, "📈 Top Gainers (24h)", "gainers"),
+                                   (losers_col, "📉 Top Losers (24h)", "losers")):
+            column.subheader(title)
+            column.dataframe([{
+                "Coin": row["name"],
+                "24h %": row["price_change_24h"],
+                "Price": row["current_price"]
+            } for row in summary[key]], hide_index=True)
+
+    # Display news separately if available
+    news_data = result["data"].get("news_data", [])
+    if "coins" in result["data"]:
+        # The same article can match several compared coins
+        news_data = list({news["url"]: news for row in result["data"]["coins"]
+                          for news in row["news_data"]}.values())
+    if news_data:
+        st.subheader("📰 Latest News")
+        for news in news_data:
+            with st.expander(news["title"]):
+                st.write(news["description"])
+                st.write(f"Source: {news['source']}")
+                st.write(f"Published: {news['published_at']}")
+                st.markdown(f"[Read more]({news['url']})")
 
 # Main chat area
 col1, col2 = st.columns([3, 1])
@@ -97,23 +259,11 @@ with col1:
     user_query = st.text_input("Ask about any cryptocurrency:",
                                placeholder="Example: What's the latest news about Ethereum?")
 
-    # Process the user query
+    # Process the user query; it is a new submission only when the text changed
     if user_query:
-        process_query(user_query)
-        
-        # Display news separately if available
-        coin = identify_coin(user_query)
-        if coin:
-            data = get_aggregated_data(coin)
-            news_data = data.get("news_data", [])
-            if news_data:
-                st.subheader("📰 Latest News")
-                for news in news_data:
-                    with st.expander(news["title"]):
-                        st.write(news["description"])
-                        st.write(f"Source: {news['source']}")
-                        st.write(f"Published: {news['published_at']}")
-                        st.markdown(f"[Read more]({news['url']})")
+        submitted = user_query != st.session_state.last_input
+        st.session_state.last_input = user_query
+        render_result(process_query(user_query, submitted))
 
     # Chat history
     if st.session_state.chat_history:
@@ -147,4 +297,9 @@ with col2:
     for example in examples:
         if st.button(example):
             # Process the example query directly
-            process_query(example)
\ No newline at end of file
+            render_result(process_query(example))
+
+# Time the run; runs that answered a query are covered by the "query" span
+if not run_state["answered"]:
+    kind = "first" if METRICS.summary("app_run") == [] else "rerun"
+    METRICS.observe("app_run", time.perf_counter() - run_start, kind=kind)
@@ -0,0 +1,105 @@
+import re
+import threading
+from typing import Any, Dict, List, Optional
+
+from api_handlers import fetch_markets_snapshot
+from price_history import PRICE_HISTORY, TREND_WINDOWS
+
+# Number of coins listed in each ranking
+MOVERS_LIMIT = 5
+
+# Questions about the market as a whole rather than one coin
+MARKET_WIDE_PATTERN = re.compile(
+    r"(?<!\w)(?:top|best|worst|biggest|gainers?|losers?|movers?|which coins?|what coins?|"
+    r"overall market|whole market|crypto market|market overview|market today|dominance)(?!\w)"
+)
+
+
+# Windows beyond the snapshot's 24h change, answered from the local price history
+HISTORY_WINDOW_PATTERNS = {
+    "1h": re.compile(r"(?<!\w)(?:hour|1h|60 ?min(?:ute)?s?)(?!\w)"),
+    "7d": re.compile(r"(?<!\w)(?:week|weekly|7d|7 days|seven days)(?!\w)"),
+    "30d": re.compile(r"(?<!\w)(?:month|monthly|30d|30 days|thirty days)(?!\w)")
+}
+
+
+def is_market_question(question: str) -> bool:
+    """Return True if a question is about the market rather than one coin"""
+    return bool(MARKET_WIDE_PATTERN.search(question.lower()))
+
+
+def detect_history_window(question: str) -> Optional[str]:
+    """Return the TREND_WINDOWS label a question asks about, if not the last 24h"""
+    question = question.lower()
+    for window, pattern in HISTORY_WINDOW_PATTERNS.items():
+        if pattern.search(question):
+            return window
+    return None
+
+
+def _rows(frame, column: str, columns: List[str]) -> List[Dict[str, Any]]:
+    return frame[["name", "symbol", column] + columns].to_dict("records")
+
+
+def summarize_markets(snapshot: Dict[str, Dict[str, Any]], limit: int = MOVERS_LIMIT) -> Dict[str, Any]:
+    """Compute market-wide rankings from a markets snapshot
+
+    The snapshot is loaded into one DataFrame, and gainers, losers, volume
+    leaders, market cap share and breadth are computed column-wise.
+    """
+    import pandas as pd
+
+    if not snapshot:
+        return {}
+    frame = pd.DataFrame(list(snapshot.values()))
+    # Missing figures arrive as "N/A"
+    for column in ("current_price", "market_cap_usd", "volume_24h", "price_change_24h"):
+        frame[column] = pd.to_numeric(frame[column], errors="coerce")
+
+    total_cap = frame["market_cap_usd"].sum()
+    total_volume = frame["volume_24h"].sum()
+    frame["market_cap_share"] = (frame["market_cap_usd"] / total_cap * 100).round(2) if total_cap else 0.0
+    frame["volume_share"] = (frame["volume_24h"] / total_volume * 100).round(2) if total_volume else 0.0
+    changes = frame["price_change_24h"].dropna()
+
+    return {
+        "coins": int(len(frame)),
+        "total_market_cap": float(total_cap),
+        "total_volume_24h": float(total_volume),
+        "advancers": int((changes > 0).sum()),
+        "decliners": int((changes < 0).sum()),
+        "median_change_24h": round(float(changes.median()), 2) if len(changes) else None,
+        "gainers": _rows(frame.nlargest(limit, "price_change_24h"), "price_change_24h", ["current_price"]),
+        "losers": _rows(frame.nsmallest(limit, "price_change_24h"), "price_change_24h", ["current_price"]),
+        "volume_leaders": _rows(frame.nlargest(limit, "volume_24h"), "volume_24h", ["volume_share"]),
+        "market_cap_share": _rows(frame.nlargest(limit, "market_cap_usd"), "market_cap_share", [])
+    }
+
+
+_summary = {"source": None, "summary": {}}
+_summary_lock = threading.Lock()
+
+
+def get_market_summary() -> Dict[str, Any]:
+    """Return market-wide rankings, recomputed only when the snapshot changes
+
+    Costs at most the one /coins/markets call behind the shared snapshot.
+    """
+    snapshot = fetch_markets_snapshot()
+    with _summary_lock:
+        if snapshot is not _summary["source"]:
+            _summary["summary"] = summarize_markets(snapshot)
+            _summary["source"] = snapshot
+        return _summary["summary"]
+
+
+def get_history_ranking(window: str, limit: int = MOVERS_LIMIT) -> Dict[str, Any]:
+    """Rank the top coins by return over a window of the local price history
+
+    Returns the best and worst performers, or {} while the history does not
+    cover the window for at least two coins.
+    """
+    ranked = PRICE_HISTORY.rank(TREND_WINDOWS[window], coins=list(fetch_markets_snapshot()))
+    if len(ranked) < 2:
+        return {}
+    return {"window": window, "best": ranked[:limit], "worst": ranked[::-1][:limit]}
@@ -0,0 +1,219 @@
+import json
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Timing samples kept per span (and label set) for percentiles
+METRICS_WINDOW = int(os.getenv("METRICS_WINDOW", "1000"))
+
+# Print one JSON line per finished span
+METRICS_LOG = os.getenv("METRICS_LOG", "False").lower() == "true"
+
+# Serve Prometheus text format on http://0.0.0.0:<port>/metrics (0 disables)
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+
+# Also emit spans through OpenTelemetry, if it is installed and configured
+OTEL_ENABLED = os.getenv("OTEL_ENABLED", "False").lower() == "true"
+
+METRIC_PREFIX = "crypto_assistant"
+
+
+def _otel_tracer():
+    if not OTEL_ENABLED:
+        return None
+    try:
+        from opentelemetry import trace
+    except ImportError:
+        print("OTEL_ENABLED is set but opentelemetry-api is not installed, skipping tracing")
+        return None
+    return trace.get_tracer("crypto-assistant")
+
+
+def _percentile(ordered: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def _format_labels(labels: Tuple[Tuple[str, str], ...]) -> str:
+    if not labels:
+        return ""
+    escaped = (
+        '{}="{}"'.format(name, value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in labels
+    )
+    return "{" + ",".join(escaped) + "}"
+
+
+class Metrics:
+    """Timing spans and counters for every stage of answering a query
+
+    A span is identified by its name and labels, e.g. ("upstream",
+    provider="binance"). Each keeps its total count, error count and summed
+    time plus the last `window` durations, from which p50/p95 are computed.
+    """
+
+    def __init__(self, window: int = METRICS_WINDOW):
+        self.window = window
+        self._spans = {}
+        self._counters = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+        self._tracer = _otel_tracer()
+
+    @staticmethod
+    def _key(name: str, labels: Dict[str, Any]):
+        return name, tuple(sorted((label, str(value)) for label, value in labels.items()))
+
+    def observe(self, name: str, seconds: float, error: bool = False, **labels):
+        """Record one finished span"""
+        key = self._key(name, labels)
+        with self._lock:
+            span = self._spans.get(key)
+            if span is None:
+                span = self._spans[key] = {"count": 0, "errors": 0, "sum": 0.0,
+                                           "samples": deque(maxlen=self.window)}
+            span["count"] += 1
+            span["errors"] += int(error)
+            span["sum"] += seconds
+            span["samples"].append(seconds)
+        if METRICS_LOG:
+            print(json.dumps({"span": name, "ms": round(seconds * 1000, 2), "error": error,
+                              "ts": time.time(), **labels}, default=str))
+
+    def increment(self, name: str, value: float = 1, **labels):
+        """Add to a counter"""
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    @contextmanager
+    def span(self, name: str, **labels):
+        """Time the enclosed block; an exception marks the span as failed"""
+        start = time.perf_counter()
+        error = False
+        otel_span = None
+        if self._tracer is not None:
+            otel_span = self._tracer.start_as_current_span(name, attributes=labels)
+            otel_span.__enter__()
+        try:
+            yield
+        except BaseException:
+            error = True
+            raise
+        finally:
+            self.observe(name, time.perf_counter() - start, error=error, **labels)
+            if otel_span is not None:
+                otel_span.__exit__(None, None, None)
+
+    def add_collector(self, collector: Callable[[], List[Tuple[str, Dict[str, Any], float]]]):
+        """Register a function returning (name, labels, value) gauges for export"""
+        with self._lock:
+            self._collectors.append(collector)
+
+    def summary(self, name: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Return count, errors, mean, p50 and p95 (in ms) per span"""
+        with self._lock:
+            spans = [(key, dict(span, samples=sorted(span["samples"])))
+                     for key, span in self._spans.items() if name is None or key[0] == name]
+        rows = []
+        for (span_name, labels), span in sorted(spans):
+            samples = span["samples"]
+            rows.append({
+                "span": span_name,
+                **dict(labels),
+                "count": span["count"],
+                "errors": span["errors"],
+                "mean_ms": round(span["sum"] / span["count"] * 1000, 1),
+                "p50_ms": round(_percentile(samples, 0.5) * 1000, 1),
+                "p95_ms": round(_percentile(samples, 0.95) * 1000, 1)
+            })
+        return rows
+
+    def prometheus_text(self) -> str:
+        """Render spans, counters and collected gauges in Prometheus text format"""
+        with self._lock:
+            spans = [(key, dict(span, samples=sorted(span["samples"]))) for key, span in self._spans.items()]
+            counters = list(self._counters.items())
+            collectors = list(self._collectors)
+
+        metric = f"{METRIC_PREFIX}_span_seconds"
+        lines = [f"# HELP {metric} Time spent per query stage.", f"# TYPE {metric} summary"]
+        for (name, labels), span in sorted(spans):
+            labels = (("span", name),) + labels
+            for quantile in (0.5, 0.95):
+                quantile_labels = _format_labels(labels + (("quantile", str(quantile)),))
+                lines.append(f"{metric}{quantile_labels} {_percentile(span['samples'], quantile):.6f}")
+            lines.append(f"{metric}_sum{_format_labels(labels)} {span['sum']:.6f}")
+            lines.append(f"{metric}_count{_format_labels(labels)} {span['count']}")
+
+        metric = f"{METRIC_PREFIX}_span_errors_total"
+        lines += [f"# HELP {metric} Failed spans per query stage.", f"# TYPE {metric} counter"]
+        for (name, labels), span in sorted(spans):
+            lines.append(f"{metric}{_format_labels((('span', name),) + labels)} {span['errors']}")
+
+        gauges = []
+        for collector in collectors:
+            try:
+                gauges += [(self._key(name, labels), value) for name, labels, value in collector()]
+            except Exception as e:
+                print(f"Error collecting metrics: {e}")
+
+        for kind, suffix, samples in (("counter", "_total", counters), ("gauge", "", gauges)):
+            family = None
+            for (name, labels), value in sorted(samples):
+                metric = f"{METRIC_PREFIX}_{name}{suffix}"
+                if metric != family:
+                    lines.append(f"# TYPE {metric} {kind}")
+                    family = metric
+                lines.append(f"{metric}{_format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        """Drop all recorded spans and counters"""
+        with self._lock:
+            self._spans.clear()
+            self._counters.clear()
+
+
+METRICS = Metrics()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = METRICS.prometheus_text().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(port: int = METRICS_PORT):
+    """Serve /metrics from a daemon thread once, if a port is configured"""
+    global _server
+    if not port:
+        return None
+    with _server_lock:
+        if _server is None:
+            try:
+                _server = ThreadingHTTPServer(("0.0.0.0", port), _MetricsHandler)
+            except OSError as e:
+                print(f"Error starting metrics server on port {port}: {e}")
+                return None
+            threading.Thread(target=_server.serve_forever, name="metrics-server", daemon=True).start()
+        return _server
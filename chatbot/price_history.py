@@ -0,0 +1,241 @@
+import atexit
+import os
+import threading
+import time
+from array import array
+from typing import Any, Dict, List, Optional
+
+# Rollup resolutions: name -> (bucket size in seconds, buckets kept)
+ROLLUPS = {
+    "1m": (60, int(os.getenv("PRICE_HISTORY_MINUTES", str(24 * 60)))),  # one day
+    "1h": (3600, int(os.getenv("PRICE_HISTORY_HOURS", str(30 * 24)))),  # 30 days
+    "1d": (86400, int(os.getenv("PRICE_HISTORY_DAYS", "365")))  # one year
+}
+
+# Directory for persisting history between restarts (empty keeps it in memory only)
+PRICE_HISTORY_DIR = os.getenv("PRICE_HISTORY_DIR", "")
+PRICE_HISTORY_SAVE_INTERVAL = float(os.getenv("PRICE_HISTORY_SAVE_INTERVAL", "300"))  # seconds
+
+# Windows summarized for the prompt's trend section
+TREND_WINDOWS = {"1h": 3600, "24h": 86400, "7d": 7 * 86400, "30d": 30 * 86400}
+
+
+class Rollup:
+    """Append-only closing prices at one resolution, held in flat arrays
+
+    A sample inside the latest bucket replaces its close; a sample for a
+    later bucket appends one. Samples older than the latest bucket are
+    ignored. The oldest buckets are trimmed in chunks past max_points.
+    """
+
+    def __init__(self, step: int, max_points: int):
+        self.step = step
+        self.max_points = max_points
+        self.times = array("d")
+        self.closes = array("d")
+
+    def add(self, timestamp: float, price: float):
+        bucket = timestamp - timestamp % self.step
+        if self.times and bucket == self.times[-1]:
+            self.closes[-1] = price
+        elif not self.times or bucket > self.times[-1]:
+            self.times.append(bucket)
+            self.closes.append(price)
+            # Trim in chunks so appends stay amortized O(1)
+            if len(self.times) > self.max_points * 1.25:
+                excess = len(self.times) - self.max_points
+                del self.times[:excess]
+                del self.closes[:excess]
+
+    def since(self, start: float):
+        """Return (times, closes) as NumPy arrays for buckets from start on"""
+        import numpy as np
+
+        times = np.array(self.times, dtype=np.float64)
+        first = int(np.searchsorted(times, start - start % self.step))
+        return times[first:], np.array(self.closes[first:], dtype=np.float64)
+
+    @property
+    def span(self) -> float:
+        """Seconds of history this resolution can hold"""
+        return self.step * self.max_points
+
+
+class PriceHistory:
+    """Local time series of prices per coin with 1m/1h/1d rollups
+
+    Fed by the CoinGecko market fetchers only, so every series is in USD
+    from one source and returns are not skewed by switching between
+    CoinGecko and Binance USDT quotes. Trend questions are answered from
+    memory instead of extra API calls. Optionally persisted to
+    PRICE_HISTORY_DIR as one .npz file per resolution. Recording needs only
+    the standard library; NumPy is imported by the first query.
+    """
+
+    def __init__(self, rollups: Dict[str, tuple] = None, directory: str = PRICE_HISTORY_DIR):
+        self.rollups = dict(rollups or ROLLUPS)
+        self.directory = directory
+        self._series = {}
+        self._lock = threading.Lock()
+        if self.directory:
+            self.load()
+
+    def record(self, coin: str, price: Any, timestamp: Optional[float] = None):
+        """Add a price sample for a coin"""
+        try:
+            price = float(price)
+        except (TypeError, ValueError):
+            return
+        if not coin or price <= 0:
+            return
+        timestamp = time.time() if timestamp is None else timestamp
+        with self._lock:
+            series = self._series.get(coin)
+            if series is None:
+                series = self._series[coin] = {name: Rollup(step, points)
+                                               for name, (step, points) in self.rollups.items()}
+            for rollup in series.values():
+                rollup.add(timestamp, price)
+
+    def record_many(self, prices: Dict[str, Any], timestamp: Optional[float] = None):
+        """Add one sample for each coin in a coin -> price mapping"""
+        timestamp = time.time() if timestamp is None else timestamp
+        for coin, price in prices.items():
+            self.record(coin, price, timestamp)
+
+    def coins(self) -> List[str]:
+        with self._lock:
+            return list(self._series)
+
+    def window(self, coin: str, seconds: float, now: Optional[float] = None):
+        """Return (times, prices) over the last `seconds`
+
+        Uses the finest resolution that covers the whole window, so a one
+        hour window has minute points and a month has hourly ones.
+        """
+        import numpy as np
+
+        now = time.time() if now is None else now
+        with self._lock:
+            series = self._series.get(coin)
+            if series is None:
+                return np.empty(0), np.empty(0)
+            for name in sorted(series, key=lambda name: series[name].step):
+                if series[name].span >= seconds:
+                    break
+            return series[name].since(now - seconds)
+
+    def performance(self, coin: str, seconds: float, now: Optional[float] = None) -> Dict[str, Any]:
+        """Return, volatility, high and low over a window, or {} without enough data
+
+        Volatility is the standard deviation of the per-bucket log returns.
+        """
+        import numpy as np
+
+        times, prices = self.window(coin, seconds, now)
+        if len(prices) < 2:
+            return {}
+        log_returns = np.diff(np.log(prices))
+        return {
+            "return_pct": round(float(prices[-1] / prices[0] - 1) * 100, 2),
+            "volatility_pct": round(float(log_returns.std()) * 100, 2),
+            "high": float(prices.max()),
+            "low": float(prices.min()),
+            "samples": int(len(prices)),
+            "covered_seconds": float(times[-1] - times[0])
+        }
+
+    def rank(self, seconds: float, coins: Optional[List[str]] = None, limit: Optional[int] = None,
+             now: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Rank coins by return over a window, best first
+
+        Coins whose history covers less than half the window are left out,
+        as in trend(). First and last prices for every coin are gathered into
+        arrays, and returns are computed and sorted in one vectorized pass.
+        """
+        import numpy as np
+
+        names, first, last = [], [], []
+        for coin in coins if coins is not None else self.coins():
+            times, prices = self.window(coin, seconds, now)
+            if len(prices) >= 2 and times[-1] - times[0] >= seconds / 2:
+                names.append(coin)
+                first.append(prices[0])
+                last.append(prices[-1])
+        if not names:
+            return []
+        returns = (np.array(last) / np.array(first) - 1) * 100
+        order = np.argsort(-returns)[:limit]
+        return [{"coin": names[i], "return_pct": round(float(returns[i]), 2)} for i in order]
+
+    def trend(self, coin: str, windows: Dict[str, float] = None) -> Dict[str, Dict[str, Any]]:
+        """Summarize a coin's performance over each of the trend windows"""
+        summary = {}
+        for label, seconds in (windows or TREND_WINDOWS).items():
+            stats = self.performance(coin, seconds)
+            # Skip windows the local history does not meaningfully cover yet
+            if stats and stats["covered_seconds"] >= seconds / 2:
+                summary[label] = stats
+        return summary
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, f"price_history_{name}.npz")
+
+    def save(self):
+        """Write every resolution to PRICE_HISTORY_DIR"""
+        if not self.directory:
+            return
+        import numpy as np
+
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with self._lock:
+                snapshot = {name: {coin: (np.array(series[name].times), np.array(series[name].closes))
+                                   for coin, series in self._series.items()}
+                            for name in self.rollups}
+            for name, columns in snapshot.items():
+                arrays = {}
+                for coin, (times, closes) in columns.items():
+                    arrays[f"{coin}|times"] = times
+                    arrays[f"{coin}|closes"] = closes
+                temporary = self._path(name) + ".tmp.npz"
+                np.savez(temporary, **arrays)
+                os.replace(temporary, self._path(name))
+        except Exception as e:
+            print(f"Error saving price history: {e}")
+
+    def load(self):
+        """Read history saved by save(), merging it into memory"""
+        import numpy as np
+
+        for name, (step, points) in self.rollups.items():
+            if not os.path.exists(self._path(name)):
+                continue
+            try:
+                with np.load(self._path(name)) as saved:
+                    with self._lock:
+                        for key in saved.files:
+                            coin, column = key.rsplit("|", 1)
+                            if column != "times":
+                                continue
+                            series = self._series.setdefault(coin, {
+                                rollup: Rollup(*self.rollups[rollup]) for rollup in self.rollups
+                            })
+                            series[name].times = array("d", saved[key][-points:])
+                            series[name].closes = array("d", saved[f"{coin}|closes"][-points:])
+            except Exception as e:
+                print(f"Error loading price history from {self._path(name)}: {e}")
+
+
+PRICE_HISTORY = PriceHistory()
+
+
+def _save_periodically():
+    while True:
+        time.sleep(PRICE_HISTORY_SAVE_INTERVAL)
+        PRICE_HISTORY.save()
+
+
+if PRICE_HISTORY_DIR:
+    threading.Thread(target=_save_periodically, name="price-history-save", daemon=True).start()
+    atexit.register(PRICE_HISTORY.save)
@@ -0,0 +1,148 @@
+import json
+import os
+import random
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+# Binance WebSocket settings - point BINANCE_WS_URL at a local server for testing
+BINANCE_WS_URL = os.getenv("BINANCE_WS_URL", "wss://stream.binance.com:9443")
+PRICE_STREAM_ENABLED = os.getenv("PRICE_STREAM_ENABLED", "False").lower() == "true"
+PRICE_STREAM_TOP_N = int(os.getenv("PRICE_STREAM_TOP_N", "20"))
+PRICE_STREAM_STALE_AFTER = float(os.getenv("PRICE_STREAM_STALE_AFTER", "15"))  # seconds
+
+# Reconnect backoff (seconds)
+RECONNECT_MIN_DELAY = 1
+RECONNECT_MAX_DELAY = 60
+
+
+class TickerTable:
+    """Latest miniTicker values per symbol, kept as compact tuples"""
+
+    def __init__(self):
+        # symbol -> (close, open, high, low, volume, updated_at)
+        self._rows = {}
+        self._lock = threading.Lock()
+        self.last_update = 0.0
+
+    def update(self, ticker: Dict[str, Any]):
+        """Store one miniTicker event"""
+        now = time.time()
+        row = (float(ticker["c"]), float(ticker["o"]), float(ticker["h"]),
+               float(ticker["l"]), float(ticker["v"]), now)
+        with self._lock:
+            self._rows[ticker["s"]] = row
+            self.last_update = now
+
+    def get(self, symbol: str, max_age: float = PRICE_STREAM_STALE_AFTER) -> Optional[Dict[str, Any]]:
+        """Return price data for a symbol, or None if unknown or stale"""
+        with self._lock:
+            row = self._rows.get(symbol)
+        if row is None or time.time() - row[5] > max_age:
+            return None
+        close, open_, high, low, volume, _ = row
+        return {
+            "symbol": symbol,
+            "price": close,
+            "price_change_percent": round((close - open_) / open_ * 100, 3) if open_ else 0.0,
+            "high_24h": high,
+            "low_24h": low,
+            "volume_24h": volume
+        }
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._rows)
+
+
+class PriceStream:
+    """Background worker feeding a TickerTable from the combined miniTicker stream"""
+
+    def __init__(self, symbols: List[str], url: str = BINANCE_WS_URL, table: Optional[TickerTable] = None):
+        self.symbols = [symbol.lower() for symbol in symbols]
+        self.url = url.rstrip("/")
+        self.table = table if table is not None else TickerTable()
+        self.connected = False
+        self.reconnects = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def stream_url(self) -> str:
+        streams = "/".join(f"{symbol}@miniTicker" for symbol in self.symbols)
+        return f"{self.url}/stream?streams={streams}"
+
+    @property
+    def stale(self) -> bool:
+        """True when disconnected or no update arrived recently"""
+        return not self.connected or time.time() - self.table.last_update > PRICE_STREAM_STALE_AFTER
+
+    def start(self):
+        """Start the worker thread"""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="price-stream", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Ask the worker thread to stop after its current receive"""
+        self._stop.set()
+
+    def _run(self):
+        import websocket
+
+        delay = RECONNECT_MIN_DELAY
+        while not self._stop.is_set():
+            ws = None
+            try:
+                ws = websocket.create_connection(self.stream_url, timeout=PRICE_STREAM_STALE_AFTER)
+                self.connected = True
+                delay = RECONNECT_MIN_DELAY
+                while not self._stop.is_set():
+                    raw = ws.recv()
+                    if not raw:
+                        raise ConnectionError("connection closed by server")
+                    message = json.loads(raw)
+                    self.table.update(message.get("data", message))
+            except Exception as e:
+                if not self._stop.is_set():
+                    print(f"Price stream disconnected: {e}")
+            finally:
+                self.connected = False
+                if ws is not None:
+                    ws.close()
+
+            if self._stop.wait(delay + random.uniform(0, delay)):
+                break
+            self.reconnects += 1
+            delay = min(delay * 2, RECONNECT_MAX_DELAY)
+
+
+_stream = None
+_stream_lock = threading.Lock()
+
+
+def start_price_stream(symbols: List[str]) -> Optional[PriceStream]:
+    """Start the shared price stream once, if enabled and websocket-client is installed"""
+    global _stream
+    if not PRICE_STREAM_ENABLED or not symbols:
+        return None
+    try:
+        import websocket  # noqa: F401
+    except ImportError:
+        print("websocket-client is not installed, using Binance REST prices only")
+        return None
+
+    with _stream_lock:
+        if _stream is None:
+            _stream = PriceStream(symbols)
+            _stream.start()
+        return _stream
+
+
+def get_streamed_price(symbol: str) -> Optional[Dict[str, Any]]:
+    """Return live price data for a Binance pair, or None to fall back to REST"""
+    stream = _stream
+    if stream is None or stream.stale:
+        return None
+    return stream.table.get(symbol)
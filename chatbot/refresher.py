@@ -0,0 +1,122 @@
+import heapq
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from config import TOP_COINS_LIMIT
+from http_client import TokenBucket
+from api_handlers import (
+    CACHE, fetch_markets_snapshot, fetch_news_entries, fetch_prices_batch, get_top_coins
+)
+
+# Background refresher that keeps the api_handlers caches warm. It runs
+# in-process when REFRESHER_ENABLED is set, or standalone: python refresher.py
+# With a shared CACHE_BACKEND, replicas running it take turns claiming each
+# job, so the fleet refreshes once per interval; alternatively run a single
+# standalone refresher for the whole fleet and leave it disabled in the apps.
+# The standalone worker needs a shared CACHE_BACKEND (redis or mongo): with the
+# in-memory cache it would only warm its own process.
+REFRESHER_ENABLED = os.getenv("REFRESHER_ENABLED", "False").lower() == "true"
+
+# Refresh at this fraction of each TTL so users never see an expired entry
+REFRESH_LEAD = float(os.getenv("REFRESH_LEAD", "0.8"))
+REFRESH_JITTER = float(os.getenv("REFRESH_JITTER", "0.1"))  # +/- fraction of the interval
+
+# Requests per minute the refresher may spend on each provider, leaving the
+# rest of each provider's limit for user-facing calls
+PROVIDER_BUDGETS = {
+    "coingecko": float(os.getenv("COINGECKO_REFRESH_BUDGET", "20")),
+    "binance": float(os.getenv("BINANCE_REFRESH_BUDGET", "60")),
+    "coindesk": float(os.getenv("COINDESK_REFRESH_BUDGET", "2"))
+}
+
+
+BUDGETS = {provider: TokenBucket(rate) for provider, rate in PROVIDER_BUDGETS.items()}
+
+
+def refresh_market_data():
+    # One markets snapshot covers the top coins list and their market data
+    BUDGETS["coingecko"].acquire()
+    fetch_markets_snapshot.refresh(TOP_COINS_LIMIT)
+    get_top_coins.refresh(TOP_COINS_LIMIT)
+
+
+def refresh_prices():
+    BUDGETS["binance"].acquire()
+    fetch_prices_batch([coin["id"] for coin in get_top_coins(TOP_COINS_LIMIT)], refresh=True)
+
+
+def refresh_news():
+    BUDGETS["coindesk"].acquire()
+    fetch_news_entries.refresh()
+
+
+# Job name -> (function, cache namespace whose TTL sets the interval)
+JOBS = {
+    "market": (refresh_market_data, "markets"),
+    "price": (refresh_prices, "price"),
+    "news": (refresh_news, "news")
+}
+
+
+def _next_interval(namespace: str) -> float:
+    interval = CACHE.ttl(namespace) * REFRESH_LEAD
+    return interval * (1 + random.uniform(-REFRESH_JITTER, REFRESH_JITTER))
+
+
+def _run_job(name: str):
+    job, _ = JOBS[name]
+    try:
+        job()
+    except Exception as e:
+        print(f"Error refreshing {name}: {e}")
+
+
+def run(stop_event: threading.Event = None):
+    """Run every job on its jittered schedule until stop_event is set
+
+    Jobs run on their own worker threads, so a job waiting on its provider
+    budget does not hold back the others; a job still running when it is
+    due again, or claimed by another replica, is skipped for that round.
+    """
+    stop_event = stop_event or threading.Event()
+    running = {}
+    # Stagger the first runs so providers are not hit all at once
+    schedule = [(time.monotonic() + random.uniform(0, 2), name) for name in JOBS]
+    heapq.heapify(schedule)
+    with ThreadPoolExecutor(max_workers=len(JOBS), thread_name_prefix="refresh") as executor:
+        while not stop_event.is_set():
+            due, name = heapq.heappop(schedule)
+            if stop_event.wait(max(0.0, due - time.monotonic())):
+                break
+            interval = _next_interval(JOBS[name][1])
+            # Another replica may already have claimed this round
+            if (name not in running or running[name].done()) and CACHE.claim(f"refresh:{name}", interval * 0.9):
+                running[name] = executor.submit(_run_job, name)
+            heapq.heappush(schedule, (time.monotonic() + interval, name))
+
+
+_refresher = None
+_refresher_lock = threading.Lock()
+
+
+def start_refresher():
+    """Start the in-process refresher thread once, if REFRESHER_ENABLED is set"""
+    global _refresher
+    if not REFRESHER_ENABLED:
+        return None
+    with _refresher_lock:
+        if _refresher is None:
+            _refresher = threading.Thread(target=run, name="cache-refresher", daemon=True)
+            _refresher.start()
+        return _refresher
+
+
+if __name__ == "__main__":
+    if CACHE.backend is None:
+        sys.exit("The standalone refresher needs a shared cache: set CACHE_BACKEND to redis or mongo. "
+                 "With the in-memory cache, set REFRESHER_ENABLED=true in the app instead.")
+    run()
@@ -0,0 +1,57 @@
+import time
+
+from answer_cache import AnswerCache, normalize_question
+
+BTC = {"market_data": {"symbol": "btc", "name": "Bitcoin", "price": 100}}
+
+
+def make_cache(**kwargs):
+    return AnswerCache(persist=False, **kwargs)
+
+
+def test_normalize_question_drops_stopwords_coin_terms_and_synonyms():
+    assert normalize_question("What is the current price of BTC?", ["btc", "bitcoin"]) == {"price"}
+    assert normalize_question("How much is Bitcoin worth", ["btc", "bitcoin"]) == {"price"}
+
+
+def test_rephrased_question_hits():
+    cache = make_cache()
+    cache.set("What is the price of Bitcoin?", BTC, {"answer": "100"})
+    assert cache.get("bitcoin price please", BTC) == {"answer": "100"}
+
+
+def test_new_data_snapshot_misses():
+    cache = make_cache()
+    cache.set("What is the price of Bitcoin?", BTC, {"answer": "100"})
+    newer = {"market_data": dict(BTC["market_data"], price=101)}
+    assert cache.get("What is the price of Bitcoin?", newer) is None
+
+
+def test_similar_question_reuses_answer():
+    cache = make_cache(similarity=0.5)
+    cache.set("bitcoin price and market cap", BTC, {"answer": "both"})
+    assert cache.get("bitcoin price", BTC) == {"answer": "both"}
+
+
+def test_opposite_questions_never_share_an_answer():
+    cache = make_cache(similarity=0.1)
+    cache.set("Should I buy bitcoin now?", BTC, {"answer": "buy"})
+    cache.set("Why is bitcoin going up?", BTC, {"answer": "up"})
+    assert cache.get("Should I sell bitcoin now?", BTC) is None
+    assert cache.get("Should I not buy bitcoin now?", BTC) is None
+    assert cache.get("Why is bitcoin going down?", BTC) is None
+
+
+def test_entries_expire_after_ttl():
+    cache = make_cache(ttl=0.05)
+    cache.set("bitcoin price", BTC, {"answer": "100"})
+    time.sleep(0.06)
+    assert cache.get("bitcoin price", BTC) is None
+
+
+def test_size_is_bounded():
+    cache = make_cache(max_size=2)
+    for question in ("bitcoin price", "bitcoin news", "bitcoin market cap"):
+        cache.set(question, BTC, {"answer": question})
+    assert cache.get("bitcoin price", BTC) is None
+    assert cache.get("bitcoin market cap", BTC) == {"answer": "bitcoin market cap"}
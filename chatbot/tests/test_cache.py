@@ -0,0 +1,113 @@
+import threading
+import time
+
+from cache import MISSING, TTLCache
+
+
+def test_get_returns_fresh_values_only():
+    cache = TTLCache({"price": 0.05})
+    cache.set("price", "BTC", 100)
+    assert cache.get("price", "BTC") == 100
+    time.sleep(0.06)
+    assert cache.get("price", "BTC") is MISSING
+
+
+def test_lru_eviction_keeps_recently_used_entries():
+    cache = TTLCache({"price": 60}, max_size=2)
+    cache.set("price", "BTC", 1)
+    cache.set("price", "ETH", 2)
+    cache.get("price", "BTC")
+    cache.set("price", "SOL", 3)
+    assert cache.get("price", "ETH") is MISSING
+    assert cache.get("price", "BTC") == 1
+    assert cache.get("price", "SOL") == 3
+    assert cache.stats()["price"]["evictions"] == 1
+
+
+def test_single_flight_coalesces_concurrent_misses():
+    cache = TTLCache({"price": 60})
+    calls = []
+    release = threading.Event()
+
+    @cache.cached("price")
+    def fetch(symbol):
+        calls.append(symbol)
+        release.wait(2)
+        return {"symbol": symbol}
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(fetch("BTC"))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.1)
+    release.set()
+    for thread in threads:
+        thread.join(2)
+
+    assert calls == ["BTC"]
+    assert results == [{"symbol": "BTC"}] * 5
+
+
+def test_single_flight_shares_exceptions():
+    cache = TTLCache({"price": 60})
+    started = threading.Event()
+    release = threading.Event()
+
+    def compute():
+        started.set()
+        release.wait(2)
+        raise ValueError("upstream down")
+
+    errors = []
+
+    def call():
+        try:
+            cache.single_flight("price", "BTC", compute)
+        except ValueError as e:
+            errors.append(str(e))
+
+    leader = threading.Thread(target=call)
+    leader.start()
+    started.wait(2)
+    follower = threading.Thread(target=call)
+    follower.start()
+    time.sleep(0.05)
+    release.set()
+    leader.join(2)
+    follower.join(2)
+    assert errors == ["upstream down", "upstream down"]
+
+
+def test_stale_while_revalidate_serves_stale_and_refreshes_in_background():
+    cache = TTLCache({"price": 0.05})
+    values = iter([1, 2])
+    refreshed = threading.Event()
+
+    @cache.cached("price", stale_while_revalidate=60)
+    def fetch(symbol):
+        value = next(values)
+        if value == 2:
+            refreshed.set()
+        return value
+
+    assert fetch("BTC") == 1
+    time.sleep(0.06)
+    assert fetch("BTC") == 1  # stale, returned without waiting
+    assert refreshed.wait(2)
+    time.sleep(0.05)
+    assert cache._lookup("price", ("BTC",))[0] == 2
+    assert cache.stats()["price"]["stale"] == 1
+
+
+def test_empty_results_are_not_cached():
+    cache = TTLCache({"news": 60})
+    calls = []
+
+    @cache.cached("news")
+    def fetch():
+        calls.append(1)
+        return []
+
+    fetch()
+    fetch()
+    assert len(calls) == 2
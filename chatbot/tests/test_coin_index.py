@@ -0,0 +1,37 @@
+from api_handlers import CoinIndex
+
+COINS = [
+    {"id": "bitcoin", "symbol": "btc", "name": "Bitcoin"},
+    {"id": "ethereum", "symbol": "eth", "name": "Ethereum"},
+    {"id": "solana", "symbol": "sol", "name": "Solana"},
+    {"id": "chainlink", "symbol": "link", "name": "Chainlink"},
+    {"id": "wrapped-bitcoin", "symbol": "wbtc", "name": "Wrapped Bitcoin"}
+]
+ALIASES = {"ether": "ethereum"}
+
+
+def test_find_returns_coins_in_order_of_appearance():
+    index = CoinIndex(COINS, ALIASES)
+    assert index.find("Compare ETH with bitcoin and eth again") == ["ethereum", "bitcoin"]
+
+
+def test_find_matches_whole_tokens_only():
+    index = CoinIndex(COINS, ALIASES)
+    assert index.find("Is there a solution for high fees?") == []
+    assert index.find("What is the SOL price?") == ["solana"]
+
+
+def test_find_prefers_the_longest_phrase():
+    index = CoinIndex(COINS, ALIASES)
+    assert index.find("price of wrapped bitcoin") == ["wrapped-bitcoin"]
+
+
+def test_find_uses_aliases():
+    index = CoinIndex(COINS, ALIASES)
+    assert index.find("how much is ether worth") == ["ethereum"]
+
+
+def test_ambiguous_words_match_only_as_uppercase_symbols():
+    index = CoinIndex(COINS, ALIASES)
+    assert index.find("send me the link to bitcoin news") == ["bitcoin"]
+    assert index.find("LINK price today") == ["chainlink"]
@@ -0,0 +1,88 @@
+import mongomock
+import pytest
+from pymongo.errors import BulkWriteError
+
+from db import WriteBehindQueue
+
+
+@pytest.fixture
+def collection():
+    return mongomock.MongoClient().crypto_ai.chat_history
+
+
+def make_queue(writer, **kwargs):
+    # Large batches and a long interval, so only flush() writes
+    return WriteBehindQueue(writer, batch_size=100, flush_interval=60, **kwargs)
+
+
+def test_flush_writes_queued_records(collection):
+    queue = make_queue(lambda records: collection.insert_many(records, ordered=False))
+    for i in range(3):
+        queue.put({"question": f"q{i}"})
+    assert collection.count_documents({}) == 0
+    assert queue.flush()
+    assert collection.count_documents({}) == 3
+    assert queue.stats()["written"] == 3
+
+
+def test_clear_drops_matching_unwritten_records(collection):
+    queue = make_queue(lambda records: collection.insert_many(records, ordered=False))
+    queue.put({"session_id": "a", "question": "q1"})
+    queue.put({"session_id": "b", "question": "q2"})
+    assert queue.clear(lambda record: record["session_id"] == "a")
+    queue.flush()
+    assert [doc["session_id"] for doc in collection.find()] == ["b"]
+
+
+def test_failed_batch_is_retried_with_the_next_flush(collection):
+    failures = [RuntimeError("MongoDB unavailable")]
+
+    def writer(records):
+        if failures:
+            raise failures.pop()
+        collection.insert_many(records, ordered=False)
+
+    queue = make_queue(writer)
+    queue.put({"question": "q1"})
+    queue.flush()
+    assert collection.count_documents({}) == 0
+    assert queue.stats()["queue_depth"] == 1
+    queue.flush()
+    assert collection.count_documents({}) == 1
+    assert queue.stats()["failures"] == 1
+
+
+def test_partial_bulk_write_retries_only_unwritten_records(collection):
+    batches = []
+
+    def writer(records):
+        batches.append([record["question"] for record in records])
+        if len(batches) == 1:
+            # The first record is stored, the second fails and the third is a duplicate
+            collection.insert_one(records[0])
+            raise BulkWriteError({"writeErrors": [{"index": 1, "code": 91, "errmsg": "shutting down"},
+                                                  {"index": 2, "code": 11000, "errmsg": "duplicate key"}],
+                                  "nInserted": 1})
+        collection.insert_many(records, ordered=False)
+
+    queue = make_queue(writer)
+    for i in range(3):
+        queue.put({"question": f"q{i}"})
+    queue.flush()
+    queue.flush()
+    assert batches == [["q0", "q1", "q2"], ["q1"]]
+    assert sorted(doc["question"] for doc in collection.find()) == ["q0", "q1"]
+
+
+def test_records_are_dropped_after_max_retries():
+    def writer(records):
+        raise RuntimeError("MongoDB unavailable")
+
+    queue = make_queue(writer, max_retries=2)
+    queue.put({"question": "q1"})
+    for _ in range(4):
+        queue.flush()
+    stats = queue.stats()
+    assert stats["failures"] == 3
+    assert stats["dropped"] == 1
+    assert stats["queue_depth"] == 0
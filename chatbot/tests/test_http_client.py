@@ -0,0 +1,111 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+import http_client
+from http_client import CircuitOpenError, ProviderClient
+
+
+class ScriptedServer:
+    """Local HTTP server answering with a scripted list of status codes, then 200"""
+
+    def __init__(self, statuses=()):
+        self.statuses = list(statuses)
+        self.requests = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                server.requests += 1
+                status = server.statuses.pop(0) if server.statuses else 200
+                body = b'{"ok": true}'
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self._server.server_port}/data"
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+@pytest.fixture
+def server():
+    server = ScriptedServer()
+    yield server
+    server.stop()
+
+
+@pytest.fixture(autouse=True)
+def fast_retries(monkeypatch):
+    monkeypatch.setattr(http_client, "HTTP_MAX_RETRIES", 2)
+    monkeypatch.setattr(http_client, "BREAKER_FAILURE_THRESHOLD", 2)
+    monkeypatch.setattr(http_client, "BREAKER_RESET_AFTER", 60)
+    monkeypatch.setattr(ProviderClient, "_backoff", staticmethod(lambda attempt, response=None: 0))
+
+
+def make_client():
+    return ProviderClient("test", rate_per_minute=6000)
+
+
+def test_retryable_status_is_retried_until_success(server):
+    server.statuses = [503, 429]
+    client = make_client()
+    response = client.get(server.url)
+    assert response.status_code == 200
+    assert server.requests == 3
+    health = client.health()
+    assert health["state"] == "closed"
+    stats = health["endpoints"]["/data"]
+    assert (stats["requests"], stats["errors"], stats["retries"]) == (3, 2, 2)
+
+
+def test_other_errors_are_returned_without_retrying(server):
+    server.statuses = [404]
+    response = make_client().get(server.url)
+    assert response.status_code == 404
+    assert server.requests == 1
+
+
+def test_breaker_opens_after_repeated_failures(server):
+    server.statuses = [500] * 6
+    client = make_client()
+    for _ in range(2):
+        assert client.get(server.url).status_code == 500
+    assert client.health()["state"] == "open"
+    requests_before = server.requests
+    with pytest.raises(CircuitOpenError):
+        client.get(server.url)
+    assert server.requests == requests_before
+
+
+def test_half_open_breaker_closes_after_a_successful_trial(server, monkeypatch):
+    server.statuses = [500] * 6
+    client = make_client()
+    for _ in range(2):
+        client.get(server.url)
+    monkeypatch.setattr(http_client, "BREAKER_RESET_AFTER", 0)
+    assert client.health()["state"] == "half-open"
+    assert client.get(server.url).status_code == 200
+    assert client.health()["state"] == "closed"
+
+
+def test_connection_errors_raise_after_retries():
+    server = ScriptedServer()
+    url = server.url
+    server.stop()
+    client = make_client()
+    with pytest.raises(requests.ConnectionError):
+        client.get(url, timeout=1)
+    assert client.health()["consecutive_failures"] == 1